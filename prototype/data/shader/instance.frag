@@ -24,6 +24,7 @@ uniform sampler2D texBlocks;
 uniform isampler2D texWorld;
 uniform sampler2D texShadow;
 uniform vec2 offset;
+uniform ivec2 world_origin;
 uniform vec2 camera;
 uniform float resolution;
 uniform float shadow_resolution;
@@ -82,6 +83,15 @@ void draw_text() {
 }
 
 
+// World ring buffer; block_coord is relative to the first visible block
+ivec4 get_block_data(ivec2 block_coord) {
+    ivec2 world_size = textureSize(texWorld, 0);
+    // Clamp to the view before wrapping, so blocks at the edge do not sample the opposite side
+    block_coord = clamp(block_coord, ivec2(0), world_size - 1);
+    return texelFetch(texWorld, (block_coord + world_origin) % world_size, 0);
+}
+
+
 // background
 ivec2 get_block_data_location(int block_type) {
     return ivec2(
@@ -156,7 +166,7 @@ void draw_background() {
     );
 
     // block data (foreground, plant, background, water level)
-    ivec4 block_data = texelFetch(texWorld, block_coord, 0);
+    ivec4 block_data = get_block_data(block_coord);
     
     // background block type
     int block_type = block_data.b;
@@ -187,7 +197,7 @@ void draw_background() {
     block_coord.y += on_edge_top - on_edge_bottom;
 
     // Get adjacent block color
-    block_type = texelFetch(texWorld, block_coord, 0).b;
+    block_type = get_block_data(block_coord).b;
     block_color = mix(get_color_block(block_type, source_pixel), block_color, block_color.a);
     block_color = mix(background_color, block_color, block_color.a);
 
@@ -349,15 +359,15 @@ vec4 get_color_foreground() {
                               gl_FragCoord.y / BLOCK_SIZE_DEST + offset.y);
 
     // Block data (foreground, plant, background, water level)
-    ivec4 block_data = texelFetch(texWorld, ivec2(block_coord), 0);
-    ivec4 block_data_left = texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y), 0);
-    ivec4 block_data_right = texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y), 0);
-    ivec4 block_data_top = texelFetch(texWorld, ivec2(block_coord.x, block_coord.y + 1), 0);
-    ivec4 block_data_bottom = texelFetch(texWorld, ivec2(block_coord.x, block_coord.y - 1), 0);
-    ivec4 block_data_top_left = texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y + 1), 0);
-    ivec4 block_data_top_right = texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y + 1), 0);
-    ivec4 block_data_bottom_left = texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y - 1), 0);
-    ivec4 block_data_bottom_right = texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y - 1), 0);
+    ivec4 block_data = get_block_data(ivec2(block_coord));
+    ivec4 block_data_left = get_block_data(ivec2(block_coord.x - 1, block_coord.y));
+    ivec4 block_data_right = get_block_data(ivec2(block_coord.x + 1, block_coord.y));
+    ivec4 block_data_top = get_block_data(ivec2(block_coord.x, block_coord.y + 1));
+    ivec4 block_data_bottom = get_block_data(ivec2(block_coord.x, block_coord.y - 1));
+    ivec4 block_data_top_left = get_block_data(ivec2(block_coord.x - 1, block_coord.y + 1));
+    ivec4 block_data_top_right = get_block_data(ivec2(block_coord.x + 1, block_coord.y + 1));
+    ivec4 block_data_bottom_left = get_block_data(ivec2(block_coord.x - 1, block_coord.y - 1));
+    ivec4 block_data_bottom_right = get_block_data(ivec2(block_coord.x + 1, block_coord.y - 1));
     
     // Block type
     int block_type = block_data.r;
@@ -469,7 +479,7 @@ vec4 get_color_foreground() {
     float distance_air = 3;
     for (int dx = -3; dx <= 3; dx += 1)
     for (int dy = -3; dy <= 3; dy += 1)
-    if (texelFetch(texWorld, ivec2(block_coord.x + dx, block_coord.y + dy), 0).r == 0) {
+    if (get_block_data(ivec2(block_coord.x + dx, block_coord.y + dy)).r == 0) {
         distance_air = min(distance_air, distance(vec2((dx + 0.5) * BLOCK_SIZE_SOURCE, (dy + 0.5) * BLOCK_SIZE_SOURCE), source_pixel) / 10);
     }
     vec4 overlay_color_sub = vec4(0, 0, 0, max(0, (distance_air - 1.5) / 1.5));
@@ -524,11 +534,11 @@ vec4 get_color_foreground() {
         block_coord += next_closest_block.zw;
         shadow_position += next_closest_block.zw;
 
-        block_data = texelFetch(texWorld, ivec2(block_coord), 0);
-        block_data_left = texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y), 0);
-        block_data_right = texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y), 0);
-        block_data_top = texelFetch(texWorld, ivec2(block_coord.x, block_coord.y + 1), 0);
-        block_data_bottom = texelFetch(texWorld, ivec2(block_coord.x, block_coord.y - 1), 0);
+        block_data = get_block_data(ivec2(block_coord));
+        block_data_left = get_block_data(ivec2(block_coord.x - 1, block_coord.y));
+        block_data_right = get_block_data(ivec2(block_coord.x + 1, block_coord.y));
+        block_data_top = get_block_data(ivec2(block_coord.x, block_coord.y + 1));
+        block_data_bottom = get_block_data(ivec2(block_coord.x, block_coord.y - 1));
 
         block_type = block_data.r;
         block_type_left = block_data_left.r;
@@ -576,8 +586,8 @@ vec4 get_color_foreground() {
     float water_level_bottom = abs(block_data_bottom.a / WATER_PER_BLOCK);
     float water_level_left = abs(block_data_left.a / WATER_PER_BLOCK);
     float water_level_right = abs(block_data_right.a / WATER_PER_BLOCK);
-    float water_level_top_left = abs(texelFetch(texWorld, ivec2(block_coord.x - 1, block_coord.y + 1), 0).a / WATER_PER_BLOCK);
-    float water_level_top_right = abs(texelFetch(texWorld, ivec2(block_coord.x + 1, block_coord.y + 1), 0).a / WATER_PER_BLOCK);
+    float water_level_top_left = abs(get_block_data(ivec2(block_coord.x - 1, block_coord.y + 1)).a / WATER_PER_BLOCK);
+    float water_level_top_right = abs(get_block_data(ivec2(block_coord.x + 1, block_coord.y + 1)).a / WATER_PER_BLOCK);
 
     water_color = get_color_block(block.water, water_source_pixel);
     water_color.a = 0.5;
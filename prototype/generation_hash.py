@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Generates the first chunk columns of worlds and prints the hash of their chunks and the generation time.
+Use it to check that changes to the world generation keep it deterministic.
+
+Usage: python generation_hash.py [seed ...]
+"""
+from scripts.game.world_generation import generate_world, get_world_hash
+from scripts.graphics.image import load_blocks
+from scripts.game.world import World
+import time
+import sys
+
+
+HASH_CHUNK_COLUMNS = 80 # Chunk columns which are generated completely (the caves are endless)
+
+class LoadingWindow:
+    def __init__(self):
+        self.loading_progress = ["", 0, 0]
+
+
+def main(seeds):
+    *block_data, block_atlas_image = load_blocks()
+
+    for seed in seeds:
+        world = World(*block_data)
+        start = time.time()
+        generate_world(world, LoadingWindow(), seed)
+        duration = time.time() - start
+
+        # Chunks are only generated when they are reached
+        world.generate(HASH_CHUNK_COLUMNS)
+        print(f"seed {seed}: {get_world_hash(world)} ({len(world.chunks)} chunks, {duration:.2f}s, {time.time() - start:.2f}s complete)")
+
+
+if __name__ == "__main__":
+    main([int(seed) for seed in sys.argv[1:]] or [0, 1, 2])
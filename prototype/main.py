@@ -24,27 +24,18 @@ from scripts.graphics.window import Window
 
 # from scripts.graphics.windowpg import Window
 from scripts.utility.geometry import *
-from scripts.game.world import World
+from scripts.game.world import World, update_pool
 from scripts.utility.const import *
 from scripts.graphics import sound
 
 # from scripts.menu.menu import Menu
 from scripts.menu.menupg import Menu
 from scripts.utility import file
+import multiprocessing
 import asyncio
 import pprint
 
 
-# Setup
-caption = "Leafy Hollows"
-*block_data, block_atlas_image = load_blocks()
-window: Window = Window(caption, block_data[0], block_atlas_image)
-menu: Menu = Menu(window)
-world: World = None
-menu.load_threaded("Leafy Hollows", "menu", window.setup)
-menu.main_page.open()
-
-
 def save_world():
     global world
     window.clear_world()
@@ -388,6 +379,7 @@ async def main():
             world.update(window)
             # t3 = time.time()
             world.update_physics(window)
+            update_pool(block_data)
             # t4 = time.time()
 
             # Update and draw the menu
@@ -412,7 +404,9 @@ async def main():
             if world.player.health <= 0:
                 world.player.state = "idle"
                 world.player.inventory.save(world)
+                world.close_file()
                 file.delete("data/user/world.data")
+                file.delete("data/user/world.data.journal")
                 menu.death_page.open()
                 menu.game_state = "death"
                 sound.play(window, "damage", channel_volume=2)
@@ -657,6 +651,17 @@ async def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # The world pool process of the frozen executable
+
+    # Setup (not run by the world pool process, which imports this file)
+    caption = "Leafy Hollows"
+    *block_data, block_atlas_image = load_blocks()
+    window: Window = Window(caption, block_data[0], block_atlas_image)
+    menu: Menu = Menu(window)
+    world: World = None
+    menu.load_threaded("Leafy Hollows", "menu", window.setup)
+    menu.main_page.open()
+
     asyncio.run(main())
 
     # import cProfile, pstats
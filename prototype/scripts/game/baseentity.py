@@ -84,9 +84,9 @@ class LivingEntity(physics.PhysicsObject):
             self.holding.cooldown -= window.delta_time
         if self.stunned:
             self.stunned = max(0, self.stunned - window.delta_time)
-        inWater = self.inWater
-        super().update(world, window.delta_time)
-        if self.vel[1] < -2 and self.inWater and not inWater:
+
+    def hit_water(self, world, window):
+        if self.vel[1] < -2:
             if self.mass < 10:
                 sound.play(window, "small_stone_hit_water", world.player.rect.x - self.rect.x)
             else:
@@ -99,12 +99,10 @@ class MeleeWeapon(BaseItem):
         self.cooldown = 1 / attack_speed
 
         targets = set()
-        for entity in world.loaded_entities:
+        for entity in world.entity_index.query_radius(attacker.rect.center, weapon_range):
             if entity is attacker or not isinstance(entity, LivingEntity):
                 continue
             entity_distance = dist(attacker.rect.center, entity.rect.center)
-            if entity_distance > weapon_range:
-                continue
             if entity_distance < 1:
                 targets.add((1, entity))
                 continue
@@ -150,7 +148,7 @@ class MeleeWeapon(BaseItem):
             particle.explosion(window, *target.rect.center, size=2.0, time=0.5)
             sound.play(window, "explosion", x=(world.player.rect.x - target.rect.x) / 5)
 
-            for entity in world.loaded_entities:
+            for entity in world.entity_index.query_radius(target.rect.center, 3):
                 if entity.type in ("enemy", "player"):
                     distance = dist(entity.rect.center, target.rect.center)
                     if distance < 3:
@@ -1,20 +1,21 @@
 # -*- coding: utf-8 -*-
-from scripts.utility.noise_functions import pnoise1, snoise2
+from scripts.utility.noise_functions import pnoise1, snoise2, pnoise1_array, snoise2_array
 from scripts.utility.const import *
 
 
-def generate_points_segment(position: [float], length, start_angle: float, deviation: float):
+def generate_points_segment(position: [float], length, start_angle: float, deviation: float, seed: float):
     angle = start_angle
     points = set()
 
     angle_change = 0
     max_angle_change = 0.5
+    noise = snoise2_array(numpy.arange(length) * 20.215 + 0.0142, seed, octaves=3).tolist()
 
     for i in range(length):
         position[0] = position[0] + cos(angle) * WORLD_GENERATION_STEP_SIZE
         position[1] = position[1] + sin(angle) * WORLD_GENERATION_STEP_SIZE
         points.add(tuple(position))
-        angle_change = snoise2(i * 20.215 + 0.0142, 1, octaves=3) * max_angle_change
+        angle_change = noise[i] * max_angle_change
         angle_change -= (angle - start_angle) / deviation * max_angle_change
         angle += angle_change
 
@@ -22,61 +23,42 @@ def generate_points_segment(position: [float], length, start_angle: float, devia
 
 
 def line_cave(world, position, length, angle, deviation, radius):
-    points = generate_points_segment(position, length, angle, deviation)
-
-    for (x, y) in points:
-        p_radius = int(pnoise1((x + y) / 2 + 100, octaves=3) * 2 + radius)
-        for delta_x in range(-p_radius - WORLD_GENERATION_CAVE_BORDER_PADDING, p_radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-            for delta_y in range(-p_radius - WORLD_GENERATION_CAVE_BORDER_PADDING, p_radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-                coord = (int(x + delta_x), int(y + delta_y))
-                if delta_x ** 2 + delta_y ** 2 <= p_radius ** 2:
-                    world.set_block(*coord, 0)
-                elif not world.get_block_exists(*coord):
-                    world.set_block(*coord, world.block_name["dirt_block"])
+    x, y = numpy.array(list(generate_points_segment(position, length, angle, deviation, world.seed))).T
+    p_radius = (pnoise1_array((x + y) / 2 + 100, octaves=3) * 2 + radius).astype(int)
+    carve(world, x, y, p_radius)
 
 
 # Called from generate_world
 def intro(world, window, position):
     surface_size = (80, 50)
-    for x in range(-surface_size[0], surface_size[0] + 1):
-        surface_level = pnoise1(x / 20 + world.seed, octaves=3) * 9
-        for y in range(-surface_size[0], surface_size[0] + 1):
-            if surface_level < y:
-                world.set_block(x, y, 0)
-            
+    x = numpy.arange(-surface_size[0], surface_size[0] + 1)[:, numpy.newaxis]
+    y = numpy.arange(-surface_size[0], surface_size[0] + 1)[numpy.newaxis, :]
+    surface_level = pnoise1_array(x / 20 + world.seed, octaves=3) * 9
+    x, y = numpy.broadcast_arrays(x, y)
+    above_surface = surface_level < y
+    clear_blocks(world, x[above_surface], y[above_surface])
+
     window.loading_progress[1] = 2
 
-    points = set()
     start_angle = angle = -pi/2
     length = INTRO_LENGTH
     deviation = 5
-    lowest = 0
 
-    for i in range(length):
-        position[0] = pnoise1(i * 16 + world.seed, octaves=2, repeat=INTRO_REPEAT * 16) * deviation
-        position[1] = -i
-        points.add(tuple(position))
+    y = -numpy.arange(length, dtype=float)
+    x = pnoise1_array(numpy.arange(length) * 16 + world.seed, octaves=2, repeat=INTRO_REPEAT * 16) * deviation
+    position[:] = x[-1], y[-1]
 
     window.loading_progress[1] = 3
 
-    for (x, y) in points:
-        radius = int((pnoise1(y + world.seed, octaves=3, repeat=INTRO_REPEAT) + 2) * 2)
-        for delta_x in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-            for delta_y in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-                coord = (int(x + delta_x), int(y + delta_y))
-                if delta_x ** 2 + (delta_y * 0.5) ** 2 <= radius ** 2:
-                    world.set_block(*coord, 0)
-                    if y + delta_y < lowest:
-                        lowest = y + delta_y
-                elif not world.get_block_exists(*coord):
-                    world.set_block(*coord, world.block_name["dirt_block"])
-    position[1] = lowest
+    radius = ((pnoise1_array(y + world.seed, octaves=3, repeat=INTRO_REPEAT) + 2) * 2).astype(int)
+    lowest = carve(world, x, y, radius, shape=lambda delta_x, delta_y, radius: delta_x ** 2 + (delta_y * 0.5) ** 2 <= radius ** 2)
+    position[1] = min(lowest, 0)
     
 
-def horizontal(world, position):
+def horizontal(world, rng, position):
     angle = snoise2(position[0] / 100 + world.seed, world.seed, octaves=2) * 0.2
-    length = random.randint(50, 150)
-    deviation = random.randint(2, 5)
+    length = rng.randint(50, 150)
+    deviation = rng.randint(2, 5)
     radius = 3
 
     line_cave(world, position, length, angle, deviation, WORLD_GENERATION_HORIZONTAL_CAVE_RADIUS)
@@ -92,38 +74,101 @@ def interpolated(world, position, start_angle=None, end_angle=None, start_radius
     if end_radius is None:
         end_radius = int(pnoise1((sum(position) + WORLD_GENERATION_INTERPOLATION_LENGTH * WORLD_GENERATION_STEP_SIZE) / 2 + 100, octaves=3) * 2 + WORLD_GENERATION_HORIZONTAL_CAVE_RADIUS)
 
+    points = []
+
     for i in range(WORLD_GENERATION_INTERPOLATION_LENGTH):
         interpolation = i / WORLD_GENERATION_INTERPOLATION_LENGTH
         angle = start_angle * (1 - interpolation) + end_angle * interpolation
         radius = round(start_radius * (1 - interpolation) + end_radius * interpolation)
 
-        x = position[0] = position[0] + cos(angle) * WORLD_GENERATION_STEP_SIZE
-        y = position[1] = position[1] + sin(angle) * WORLD_GENERATION_STEP_SIZE
+        position[0] = position[0] + cos(angle) * WORLD_GENERATION_STEP_SIZE
+        position[1] = position[1] + sin(angle) * WORLD_GENERATION_STEP_SIZE
+        points.append((*position, radius))
 
-        for delta_x in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-            for delta_y in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-                coord = (int(x + delta_x), int(y + delta_y))
-                if delta_x ** 2 + delta_y ** 2 <= radius ** 2:
-                    world.set_block(*coord, 0)
-                elif not world.get_block_exists(*coord):
-                    world.set_block(*coord, world.block_name["dirt_block"])
+    x, y, radius = numpy.array(points).T
+    carve(world, x, y, radius.astype(int))
 
 
-def vertical(world, position):
-    angle = pi / 2 * 3 * (random.randint(0, 1) * 2 - 1)
-    length = random.randint(60, 70)
+def vertical(world, rng, position):
+    angle = pi / 2 * 3 * (rng.randint(0, 1) * 2 - 1)
+    length = rng.randint(60, 70)
     deviation = 0.3
     radius = 2.5
 
     line_cave(world, position, length, angle, deviation, radius)
 
 
+# Called from generate_pole
+def shaft(world, x, start_y, end_y):
+    """
+    Straight vertical cave, which replaces a vertical cave without space for a pole.
+    """
+    y = numpy.arange(min(start_y, end_y), max(start_y, end_y) + 1, WORLD_GENERATION_STEP_SIZE)
+    carve(world, numpy.full(y.shape, x), y, numpy.full(y.shape, WORLD_GENERATION_SHAFT_RADIUS))
+
+
 def blob(world, position):
     radius = int((pnoise1(position[0] + world.seed, octaves=3) + 3) * 3)
-    for delta_x in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-        for delta_y in range(-radius - WORLD_GENERATION_CAVE_BORDER_PADDING, radius + WORLD_GENERATION_CAVE_BORDER_PADDING + 1):
-            coord = (int(position[0] + delta_x), int(position[1] + delta_y))
-            if delta_y > 0 and delta_x ** 2 + (delta_y * 0.8) ** 2 <= radius ** 2:
-                world.set_block(*coord, 0)
-            elif delta_x ** 2 + (delta_y * 2) ** 2 <= radius ** 2:
-                world.set_block(*coord, 0)
+    carve(world, numpy.array([position[0]]), numpy.array([position[1]]), numpy.array([radius]), fill_padding=False, shape=blob_shape)
+
+
+def blob_shape(delta_x, delta_y, radius):
+    return ((delta_y > 0) & (delta_x ** 2 + (delta_y * 0.8) ** 2 <= radius ** 2)) | (delta_x ** 2 + (delta_y * 2) ** 2 <= radius ** 2)
+
+
+def disk_shape(delta_x, delta_y, radius):
+    return delta_x ** 2 + delta_y ** 2 <= radius ** 2
+
+
+def carve(world, x, y, radius, fill_padding: bool=True, shape=disk_shape):
+    """
+    Carve a path of shapes centered at (x, y) into the world at once.
+    Returns the lowest carved y coordinate.
+    Chunks within the padding around each shape are created, so that caves are surrounded by terrain.
+    """
+    size = radius + WORLD_GENERATION_CAVE_BORDER_PADDING
+    max_size = int(size.max())
+    delta = numpy.arange(-max_size, max_size + 1)
+    delta_x, delta_y = numpy.meshgrid(delta, delta, indexing="ij", sparse=True) # Offsets of the shape (column and row)
+    size = size[:, numpy.newaxis, numpy.newaxis]
+
+    # Carved blocks of each shape (shape index, offset index x, offset index y)
+    carved = (numpy.abs(delta_x) <= size) & (numpy.abs(delta_y) <= size) & shape(delta_x, delta_y, radius[:, numpy.newaxis, numpy.newaxis])
+    shape_index, delta_index_x, delta_index_y = numpy.nonzero(carved)
+    carved_y = y[shape_index] + delta[delta_index_y]
+    blocks_x = numpy.trunc(x[shape_index] + delta[delta_index_x]).astype(int)
+    blocks_y = numpy.trunc(carved_y).astype(int)
+
+    if fill_padding:
+        chunks = numpy.stack((
+            numpy.trunc(x - size[:, 0, 0]).astype(int) >> WORLD_CHUNK_SIZE_POWER,
+            numpy.trunc(x + size[:, 0, 0]).astype(int) >> WORLD_CHUNK_SIZE_POWER,
+            numpy.trunc(y - size[:, 0, 0]).astype(int) >> WORLD_CHUNK_SIZE_POWER,
+            numpy.trunc(y + size[:, 0, 0]).astype(int) >> WORLD_CHUNK_SIZE_POWER
+        ), axis=1)
+        for start_chunk_x, end_chunk_x, start_chunk_y, end_chunk_y in numpy.unique(chunks, axis=0).tolist():
+            for chunk_x in range(start_chunk_x, end_chunk_x + 1):
+                for chunk_y in range(start_chunk_y, end_chunk_y + 1):
+                    if not world.get_chunk_exists(chunk_x, chunk_y):
+                        world.create_chunk(chunk_x, chunk_y)
+
+    clear_blocks(world, blocks_x, blocks_y)
+
+    if len(carved_y):
+        return carved_y.min()
+    return 0
+
+
+def clear_blocks(world, x, y):
+    """
+    Set the foreground of many blocks to air, with one blit per chunk.
+    """
+    chunks, inverse = numpy.unique(numpy.stack((x >> WORLD_CHUNK_SIZE_POWER, y >> WORLD_CHUNK_SIZE_POWER), axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    air = numpy.zeros((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE), dtype=WORLD_CHUNK_DTYPE)
+    for index, (chunk_x, chunk_y) in enumerate(chunks.tolist()):
+        selected = inverse == index
+        mask = numpy.zeros((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE), dtype=bool)
+        mask[x[selected] & (WORLD_CHUNK_SIZE - 1), y[selected] & (WORLD_CHUNK_SIZE - 1)] = True
+        world.blit(chunk_x * WORLD_CHUNK_SIZE, chunk_y * WORLD_CHUNK_SIZE, air, 0, mask)
@@ -102,7 +102,7 @@ class BlueSlime(GreenSlime):
         
 
 class Goblin(LivingEntity):
-    def __init__(self, spawn_pos: [float]):
+    def __init__(self, spawn_pos: [float], weapon: type=None):
         base_health = 10
         health = min(round(base_health * (1 + spawn_pos[0] / 100 / base_health)), 30)
         super().__init__(30, spawn_pos, GOBLIN_RECT_SIZE, health=health)
@@ -115,7 +115,7 @@ class Goblin(LivingEntity):
         self.prepare_attack_length: float = 0.4
         self.prepare_attack: float = self.prepare_attack_length
 
-        self.holding = random.choice((Stick, Sword, Axe, Pickaxe, Bow))(1)
+        self.holding = (weapon or random.choice(ENEMY_WEAPONS))(1)
         if isinstance(self.holding, Bow):
             self.holding.attributes["longshot"] = 3
             self.prepare_attack_length *= 5
@@ -241,7 +241,7 @@ class Bat(LivingEntity):
                 if self.path_search_delay > PATH_FIND_DELAY: # Recalculate path when player moved too far
                     self.path_search_delay = 0
 
-                    grid: list[list[int, int]] = numpy.swapaxes(world.view[:, :, 0], 0, 1)
+                    grid: list[list[int, int]] = numpy.swapaxes(world.block_solid[world.get_view()[:, :, 0]], 0, 1)
 
                     # Vector approach; flipped vector directions, now it works, don't know why
                     # Start search from player to reverse path
@@ -346,4 +346,8 @@ class Crate(LivingEntity):
         window.draw_image(self.image, rect[:2], rect[2:])
 
     def update(self, world, window: Window):
-        super().update(world, window)
\ No newline at end of file
+        super().update(world, window)
+
+
+ENEMY_KINDS: tuple = (GreenSlime, YellowSlime, BlueSlime, Bat, Goblin) # Kinds of enemies in spawn records
+ENEMY_WEAPONS: tuple = (Stick, Sword, Axe, Pickaxe, Bow) # Weapons of enemies in spawn records
\ No newline at end of file
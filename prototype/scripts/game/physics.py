@@ -70,31 +70,6 @@ class PhysicsObject:
         self.vel[0] += cos(angle) * acceleration * delta_time
         self.vel[1] += sin(angle) * acceleration * delta_time
     
-    def apply_velocity(self, world, delta_time: float):
-        """
-        Applies velocity to the object.
-        """
-        last_position = self.rect.center
-
-        self.rect.x += min(PHYSICS_MAX_MOVE_DISTANCE, max(-PHYSICS_MAX_MOVE_DISTANCE, self.vel[0] * delta_time))
-        self.rect.x = round(self.rect.x, 5) # Bugs occur at higher precision
-        self.x_collide(world, delta_time)
-    
-        self.rect.y += min(PHYSICS_MAX_MOVE_DISTANCE, max(-PHYSICS_MAX_MOVE_DISTANCE, self.vel[1] * delta_time))
-        self.rect.y = round(self.rect.y, 5)
-        self.y_collide(world)
-
-        # Reset object position
-        if self.get_collision(world):
-            self.rect.center = last_position
-            self.vel = [0, 0]
-
-        ## Push water to adjacent blocks
-        #stength = (abs(self.vel[0]) + abs(self.vel[1])) * 5
-        ##block_feet = (floor(self.rect.centerx), round(self.rect.y))
-        #block_feet = (floor(self.rect.centerx), round(self.rect.top))
-        #...
-
     def get_collision(self, world):
         """
         Returns whether the object collides with a block.
@@ -102,150 +77,273 @@ class PhysicsObject:
         for x in range(floor(self.rect.left), ceil(self.rect.right)):
             #for y in range(floor(self.rect.y), ceil(self.rect.y + self.rect.h)):
             for y in range(floor(self.rect.top), ceil(self.rect.bottom)):
-                if world.get_block(x, y):
+                if world.block_solid[world.get_block(x, y)]:
                     return True
         return False
 
-    def apply_gravity_force(self, delta_time):
+    def get_moving(self):
+        """
+        Returns whether the object is moved by the physics world.
+        """
+        return True
+
+    def hit_water(self, world, window):
+        """
+        Called after the object entered water.
+        """
+        pass
+
+
+class PhysicsWorld:
+    """
+    Moves all loaded physics objects at once.
+    Their positions, sizes, velocities, masses and adjacent blocks are copied into arrays, stepped and copied back.
+    """
+    def __init__(self):
+        self.objects: list = []
+        self.object_index: dict = {} # {object: index}
+        self.position: numpy.ndarray = numpy.zeros((0, 2)) # Bottom left corner
+        self.size: numpy.ndarray = numpy.zeros((0, 2))
+        self.velocity: numpy.ndarray = numpy.zeros((0, 2))
+        self.mass: numpy.ndarray = numpy.zeros(0)
+        self.blocks: numpy.ndarray = numpy.zeros((0, 4), dtype=int) # Blocks below, above, left and right
+        self.in_water: numpy.ndarray = numpy.zeros(0, dtype=bool)
+        self.under_water: numpy.ndarray = numpy.zeros(0, dtype=int)
+        self.player: numpy.ndarray = numpy.zeros(0, dtype=bool) # Players are pushed up single blocks
+        self.start_position: numpy.ndarray = numpy.zeros((0, 2)) # Position before the last step
+        self.entered_water: numpy.ndarray = numpy.zeros(0, dtype=bool) # Objects which entered water in the last step
+
+    def load(self, objects: list):
+        """
+        Copy the state of the objects into arrays.
+        """
+        self.objects = list(objects)
+        self.object_index = {obj: index for index, obj in enumerate(self.objects)}
+        self.position = numpy.array([(obj.rect.x, obj.rect.y) for obj in self.objects], dtype=float).reshape(-1, 2)
+        self.size = numpy.array([(obj.rect.w, obj.rect.h) for obj in self.objects], dtype=float).reshape(-1, 2)
+        self.velocity = numpy.array([obj.vel for obj in self.objects], dtype=float).reshape(-1, 2)
+        self.mass = numpy.array([obj.mass for obj in self.objects], dtype=float)
+        self.blocks = numpy.array([(obj.block_below, obj.block_above, obj.block_left, obj.block_right) for obj in self.objects], dtype=int).reshape(-1, 4)
+        self.in_water = numpy.array([obj.inWater for obj in self.objects], dtype=bool)
+        self.under_water = numpy.array([obj.underWater for obj in self.objects], dtype=int)
+        self.player = numpy.array([obj.type == "player" for obj in self.objects], dtype=bool)
+
+    def store(self):
         """
-        Applies gravity force to the object.
+        Copy the arrays back into the objects.
         """
-        self.apply_force(PHYSICS_GRAVITY_CONSTANT * self.mass, 270, delta_time)
+        for obj, (x, y), vel, (below, above, left, right), in_water, under_water in zip(
+            self.objects, self.position.tolist(), self.velocity.tolist(), self.blocks.tolist(), self.in_water.tolist(), self.under_water.tolist()
+        ):
+            obj.rect.x, obj.rect.y = x, y
+            obj.vel = vel
+            obj.block_below, obj.block_above, obj.block_left, obj.block_right = below, above, left, right
+            obj.inWater, obj.underWater = in_water, under_water
+
+    def get_start_center(self, obj):
+        """
+        Returns the center of an object before the last step, None if it was not moved.
+        """
+        if not obj in self.object_index:
+            return None
+        x, y = self.start_position[self.object_index[obj]].tolist()
+        return (x + obj.rect.w / 2, y + obj.rect.h / 2)
 
-    def apply_friction_force(self, delta_time):
+    def get_entered_water(self):
+        return [self.objects[index] for index in numpy.flatnonzero(self.entered_water)]
+
+    def step(self, world, objects: list, delta_time: float):
         """
-        Applies friction force against velocity direction to the object.
+        Move the objects: water drag, velocity and block collisions, gravity, friction and pushing apart.
         """
-        if not all(self.vel):
+        self.load(objects)
+        self.start_position = self.position.copy()
+        if not self.objects:
+            self.entered_water = numpy.zeros(0, dtype=bool)
             return
-        velocity_product = -self.vel[0]# * min(1, abs(self.vel[1]))
-
-
-        block_friction = 0.5 * 10
-        
-        # Horizontal friction on ground or ceiling
-        touching = max(self.block_below, self.block_above)
-        if touching:
-            force = velocity_product * block_friction * self.mass
-            #print(1, round(self.vel[0], 2))
-            self.apply_force_horizontal(force, delta_time)
-            #print(2, round(self.vel[0], 2))
-        
-        # Vertical friction on walls
-        touching = max(self.block_left, self.block_right)
-        if touching:
-            force = velocity_product * block_friction * self.mass
-            self.apply_force_vertical(force, delta_time)
-    
-    def x_collide(self, world, delta_time):
-        """
-        Resolves collisions on the x-axis.
-        """
-        last_y = self.rect.y
-        collision = False
-        if self.vel[0]:
-            self.block_right = self.block_left = 0
-
-        for x in range(floor(round(self.rect.left, 5)), ceil(round(self.rect.right, 5))):
-            #for y in range(floor(round(self.rect.y, 5)), ceil(round(self.rect.y + self.rect.h, 5))):
-            for y in range(floor(round(self.rect.top, 5)), ceil(round(self.rect.bottom, 5))):
-                if world.get_block(x, y):
-                    
-                    # Push player up if possible (instead of colliding)
-                    self.rect.y = ceil(self.rect.y)
-                    if not (self.type != "player" or self.vel[1] <= 0 or abs(self.vel[0]) < 1 or self.rect.y - last_y > 0.5 or collision or self.get_collision(world)):
-                        self.vel[1] *= 0.8
-                        continue
-
-                    if self.vel[0] < 0:
-                        self.rect.left = x + 1
-                        self.block_left = world.get_block(x, y, generate=False)
-
-                    if self.vel[0] > 0:
-                        self.rect.right = x
-                        self.block_right = world.get_block(x, y, generate=False)
-                    collision = True
-
-        if collision:
-            self.vel[0] = 0
-            self.rect.y = last_y
-
-        return collision
-
-    def y_collide(self, world):
-        """
-        Resolves collisions on the y-axis.
-        """
-        if any(self.vel):
-            self.block_above = self.block_below = 0
-        for x in range(floor(round(self.rect.left, 5)), ceil(round(self.rect.right, 5))):
-            #for y in range(floor(round(self.rect.y, 5)), ceil(round(self.rect.y + self.rect.h, 5))):
-            for y in range(floor(round(self.rect.top, 5)), ceil(round(self.rect.bottom, 5))):
-                if world.get_block(x, y):
-                    if self.vel[1] > 0:
-                        self.rect.bottom = y
-                        self.block_above = world.get_block(x, y, generate=False)
-
-                    if self.vel[1] < 0:
-                        self.rect.top = y + 1
-                        self.block_below = world.get_block(x, y, generate=False)
-
-                    self.vel[1] = 0#self.vel[1] // 2
-
-    def update(self, world, delta_time):
-        """
-        Moves the object.
-        """
-        #if (not hasattr(self, "can_move") and not self.can_move):
-        #    self.apply_force(delta_time * abs(world.wind) / (self.mass), 90 + 90 * min(1, max(-1, -world.wind)), self.mass)
-        #if self.block_below:
-        #    self.block_below -= 1
-
-            #block_friction = self.get_ground_friction(world)
-            #block_friction = 0.1
-            #friction = copysign(delta_time / block_friction, self.vel[0])
-            #if abs(friction) > abs(self.vel[0]):
-            #    self.vel[0] = 0
-            #else:
-            #    self.vel[0] -= friction
-        #if self.block_left:
-        #    self.block_left -= 1
-        #if self.block_right:
-        #    self.block_right -= 1
-
-        block_feet = (floor(self.rect.centerx), round(self.rect.top))
-        block_head = (floor(self.rect.centerx), round(self.rect.bottom))
-        #block_feet = (floor(self.rect.centerx), round(self.rect.y))
-        #block_head = (floor(self.rect.centerx), round(self.rect.y + self.rect.h))
-
-        self.inWater = world.get_water(*block_feet) > 0.2
-        if self.inWater and world.get_water(*block_head) > 0.2:
-            self.underWater = 5
-            self.vel[0] *= 0.2 ** delta_time
-        elif self.underWater:
-            self.underWater -= 1
+
+        # Water at the feet and the head
+        feet_x = numpy.floor(self.position[:, 0] + self.size[:, 0] / 2).astype(int)
+        feet_y = numpy.round(self.position[:, 1]).astype(int)
+        head_y = numpy.round(self.position[:, 1] + self.size[:, 1]).astype(int)
+        in_water = numpy.abs(world.get_blocks(feet_x, feet_y, layer=3)) > 0.2
+        under_water = in_water & (numpy.abs(world.get_blocks(feet_x, head_y, layer=3)) > 0.2)
+        self.entered_water = in_water & ~self.in_water
+        self.in_water = in_water
+        self.under_water = numpy.where(under_water, 5, numpy.maximum(self.under_water - 1, 0))
+        self.velocity[under_water, 0] *= 0.2 ** delta_time
 
         # Add velocity to position
-        self.apply_velocity(world, delta_time)
+        self.move(world, delta_time)
 
-        # Apply gravity and friction
-        self.apply_gravity_force(delta_time)
+        # Gravity
+        self.velocity[:, 1] -= PHYSICS_GRAVITY_CONSTANT * delta_time
 
         # Friction
-        block_fricton = world.get_block_friction(self.block_below)
-        if block_fricton:
-            self.apply_force_horizontal(-self.vel[0] * self.mass * block_fricton * 0.1, 1)
-            self.vel[0] *= 0.9 ** delta_time
-
-        # Entity collision
-        for other in world.loaded_entities:
-            if other is self:
-                continue
-            
-            distance = dist(self.rect.center, other.rect.center)
-            if distance > 1:
-                continue
+        block_friction = world.block_friction[self.blocks[:, 0]]
+        self.velocity[:, 0] -= self.velocity[:, 0] * block_friction * 0.1
+        self.velocity[:, 0] *= numpy.where(block_friction != 0, 0.9 ** delta_time, 1)
+
+        # Push objects apart
+        center = self.position + self.size / 2
+        first, second = self.get_close_pairs(center)
+        delta = center[first] - center[second]
+        distance = numpy.hypot(delta[:, 0], delta[:, 1])
+        pushed = distance <= 1
+        if pushed.any():
+            first, delta, distance = first[pushed], delta[pushed], distance[pushed]
+            angle = numpy.arctan2(delta[:, 1] * 0.5, delta[:, 0] + numpy.random.random(distance.shape) * 0.1)
+            acceleration = (1 - distance) * 500 / self.mass[first] * delta_time
+            numpy.add.at(self.velocity[:, 0], first, numpy.cos(angle) * acceleration)
+            numpy.add.at(self.velocity[:, 1], first, numpy.sin(angle) * acceleration)
+
+        self.store()
+
+    @staticmethod
+    def get_close_pairs(center):
+        """
+        Returns the indices (first, second) of all ordered pairs of different objects, whose centers are in the same or adjacent cells of size 1.
+        The centers are binned into cells, so the pairs grow with the number of close objects instead of all pairs of objects.
+        """
+        cell = numpy.floor(center).astype(numpy.int64)
+        key = cell[:, 0] * 2 ** 32 + cell[:, 1]
+        order = numpy.argsort(key)
+        sorted_key = key[order]
+        first, second = [], []
+        for offset_x in (-1, 0, 1):
+            for offset_y in (-1, 0, 1):
+                neighbour_key = key + offset_x * 2 ** 32 + offset_y
+                start = numpy.searchsorted(sorted_key, neighbour_key, side="left")
+                count = numpy.searchsorted(sorted_key, neighbour_key, side="right") - start
+                total = int(count.sum())
+                if not total:
+                    continue
+                offset = numpy.arange(total) - numpy.repeat(numpy.cumsum(count) - count, count)
+                first.append(numpy.repeat(numpy.arange(len(center)), count))
+                second.append(order[numpy.repeat(start, count) + offset])
+        if not first:
+            return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+        first, second = numpy.concatenate(first), numpy.concatenate(second)
+        different = first != second
+        return first[different], second[different]
+
+    def get_solid(self, world, start_x, start_y, end_x, end_y):
+        """
+        Returns the blocks of the areas from start to end (exclusive) of each object.
+        Returns (solid mask (n x width x height), blocks (n x width x height)), padded to the largest area.
+        """
+        width = max(1, int(numpy.max(end_x - start_x, initial=0)))
+        height = max(1, int(numpy.max(end_y - start_y, initial=0)))
+        block_x = start_x[:, None] + numpy.arange(width)
+        block_y = start_y[:, None] + numpy.arange(height)
+        blocks = world.get_blocks(block_x[:, :, None], block_y[:, None, :])
+        solid = world.block_solid[blocks] & (block_x < end_x[:, None])[:, :, None] & (block_y < end_y[:, None])[:, None, :]
+        return solid, blocks
+
+    def get_area(self, index, axis: int):
+        """
+        Returns the blocks (start, end) which the objects overlap on an axis.
+        """
+        start = self.position[index, axis]
+        return (
+            numpy.floor(start + PHYSICS_CONTACT_EPSILON).astype(int),
+            numpy.ceil(start + self.size[index, axis] - PHYSICS_CONTACT_EPSILON).astype(int)
+        )
 
-            push_strength = (1 - distance) * 500
-            angle = atan2((self.rect.centery - other.rect.centery) * 0.5, self.rect.centerx - other.rect.centerx + random.random() * 0.1)
-            self.apply_force(push_strength, angle, delta_time, is_radians=True)
+    def move(self, world, delta_time: float):
+        """
+        Sweep the objects along their velocity through the block grid (DDA).
+        Each step advances the objects to the next block boundary, which their leading edge crosses, and checks only the entered blocks.
+        An axis stops at the time of impact with a solid block and the object slides along the other axis.
+        Players are pushed up single blocks instead of colliding.
+        """
+        movement = self.velocity * delta_time
+        direction = numpy.sign(movement).astype(int)
+        moving = direction != 0
+        self.blocks[moving[:, 0], 2:] = 0
+        self.blocks[moving.any(axis=1), :2] = 0
+
+        origin = self.position.copy() # Position at time 0 (moved when a player is pushed up)
+        edge = origin + self.size * (direction > 0) # Leading edge at time 0
+        boundary = numpy.where(direction > 0, numpy.ceil(edge - PHYSICS_CONTACT_EPSILON), numpy.floor(edge + PHYSICS_CONTACT_EPSILON)).astype(int)
+        time = numpy.zeros(len(self.objects)) # Part of the movement done
+
+        while True:
+            # Time at which the next block boundary is crossed on each axis
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                boundary_time = numpy.where(moving, (boundary - edge) / movement, inf)
+            boundary_time = numpy.maximum(boundary_time, time[:, None])
+            next_time = numpy.min(boundary_time, axis=1)
+            crossing = numpy.flatnonzero(next_time < 1)
+            if not len(crossing):
+                break
+
+            time[crossing] = next_time[crossing]
+            self.position[crossing] = numpy.where(moving[crossing], origin[crossing] + movement[crossing] * time[crossing, None], self.position[crossing])
+            axis = numpy.argmin(boundary_time[crossing], axis=1)
+
+            # Entered column
+            index = crossing[axis == 0]
+            if len(index):
+                column = boundary[index, 0] - (direction[index, 0] < 0)
+                start_y, end_y = self.get_area(index, 1)
+                solid, blocks = self.get_solid(world, column, start_y, column + 1, end_y)
+                solid_count = solid.sum(axis=(1, 2))
+                hit = solid_count > 0
+
+                # Push player up
+                step_up = hit & self.player[index] & (self.velocity[index, 1] > 0) & (numpy.abs(self.velocity[index, 0]) >= 1)
+                raised_y = numpy.ceil(self.position[index, 1])
+                step_up &= raised_y - self.position[index, 1] <= 0.5
+                if step_up.any():
+                    start_x, end_x = self.get_area(index, 0)
+                    start_x, end_x = numpy.minimum(start_x, column), numpy.maximum(end_x, column + 1)
+                    raised_start_y = numpy.floor(raised_y + PHYSICS_CONTACT_EPSILON).astype(int)
+                    raised_end_y = numpy.ceil(raised_y + self.size[index, 1] - PHYSICS_CONTACT_EPSILON).astype(int)
+                    step_up &= ~self.get_solid(world, start_x, raised_start_y, end_x, raised_end_y)[0].any(axis=(1, 2))
+
+                    raised = index[step_up]
+                    offset = raised_y[step_up] - self.position[raised, 1]
+                    self.position[raised, 1] += offset
+                    origin[raised, 1] += offset
+                    edge[raised, 1] += offset
+                    boundary[raised, 1] = numpy.ceil(self.position[raised, 1] + self.size[raised, 1] - PHYSICS_CONTACT_EPSILON)
+                    self.velocity[raised, 1] *= 0.8 ** solid_count[step_up]
+                hit &= ~step_up
+
+                # Stop at the highest solid block
+                solid = solid[:, 0, :]
+                last = solid.shape[1] - 1 - numpy.argmax(solid[:, ::-1], axis=1)
+                last_block = blocks[numpy.arange(len(index)), 0, last]
+                left = hit & (direction[index, 0] < 0)
+                self.position[index[left], 0] = column[left] + 1
+                self.blocks[index[left], 2] = last_block[left]
+                right = hit & (direction[index, 0] > 0)
+                self.position[index[right], 0] = column[right] - self.size[index[right], 0]
+                self.blocks[index[right], 3] = last_block[right]
+                self.velocity[index[hit], 0] = 0
+                moving[index[hit], 0] = False
+                boundary[index[~hit], 0] += direction[index[~hit], 0]
+
+            # Entered row
+            index = crossing[axis == 1]
+            if len(index):
+                row = boundary[index, 1] - (direction[index, 1] < 0)
+                start_x, end_x = self.get_area(index, 0)
+                solid, blocks = self.get_solid(world, start_x, row, end_x, row + 1)
+                hit = solid.any(axis=(1, 2))
+
+                # Stop at the leftmost solid block
+                solid = solid[:, :, 0]
+                first_block = blocks[numpy.arange(len(index)), numpy.argmax(solid, axis=1), 0]
+                down = hit & (direction[index, 1] < 0)
+                self.position[index[down], 1] = row[down] + 1
+                self.blocks[index[down], 0] = first_block[down]
+                up = hit & (direction[index, 1] > 0)
+                self.position[index[up], 1] = row[up] - self.size[index[up], 1]
+                self.blocks[index[up], 1] = first_block[up]
+                self.velocity[index[hit], 1] = 0
+                moving[index[hit], 1] = False
+                boundary[index[~hit], 1] += direction[index[~hit], 1]
+
+        self.position = numpy.where(moving, origin + movement, self.position)
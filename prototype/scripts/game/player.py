@@ -173,8 +173,8 @@ class Player(LivingEntity):
         """
         block_head = world.get_block(round(self.rect.x), round(self.rect.y + 0.8), layer=2)
         block_feet = world.get_block(round(self.rect.x), round(self.rect.y - 0.2), layer=2)
-        grab_pole = block_head in world.blocks_climbable
-        on_pole = block_feet in world.blocks_climbable and grab_pole
+        grab_pole = world.block_climbable[block_head]
+        on_pole = world.block_climbable[block_feet] and grab_pole
 
         if window.keybind("jump") and (on_pole or grab_pole):
             self.on_pole = True
@@ -190,7 +190,7 @@ class Player(LivingEntity):
             elif grab_pole and not window.keybind("crouch"):
                 self.rect.x = round(self.rect.x)
                 self.vel[0] = 0
-                if world.get_block(round(self.rect.x), round(self.rect.y + 1), layer=2) in world.blocks_climbable:
+                if world.block_climbable[world.get_block(round(self.rect.x), round(self.rect.y + 1), layer=2)]:
                     self.vel[1] = max(self.climb_speed, self.vel[1])
                     self.state = "climb_pole"
                     self.direction = 0
@@ -299,7 +299,7 @@ class Player(LivingEntity):
         ground_block = world.get_block(*ground_block_coord)
         sound_file = ""
 
-        ground_block_family = world.block_family[world.block_index[ground_block]]
+        ground_block_family = world.block_families[world.block_family_id[ground_block]]
         if self.state == "sprint":
             if ground_block_family == "dirt":
                 sound_file = "player_run_grass"
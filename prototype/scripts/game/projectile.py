@@ -28,9 +28,27 @@ class Arrow(PhysicsObject):
         rect = window.camera.map_coord((self.rect.x - 0.25 + self.rect.w / 2, self.rect.y - 0.25 + self.rect.h / 2, 0.5, 0.5), from_world=True)
         window.draw_image("arrow", rect[:2], rect[2:], angle=degrees(self.angle))
 
+    def get_moving(self):
+        # Arrows stay in walls
+        return not (self.block_above or self.block_below or self.block_left or self.block_right)
+
     def update(self, world, window: Window):
+        # Hurt entities along the last movement
+        last_center = world.physics.get_start_center(self)
+        if not last_center is None:
+            for entity in world.entity_index.query_segment(self.rect.center, last_center):
+                if (not (entity is self or entity is self.owner)) and isinstance(entity, LivingEntity):
+                    damage, attack_speed, weapon_range, crit_chance = self.bow.get_weapon_stat_increase(world)
+                    damage *= 1 + 0.5 * (crit_chance > random.random())
+                    entity.damage(window, damage, Vec(*self.vel).normalized)
+
+                    self.bow.apply_attributes(window, self.owner, entity)
+                    self.explode(window, world)
+                    world.remove_entity(self)
+                    return
+
         # Cancel when arrow in wall
-        if self.block_above or self.block_below or self.block_left or self.block_right:
+        if not self.get_moving():
             if any(self.vel):
                 self.explode(window, world)
             return
@@ -38,31 +56,15 @@ class Arrow(PhysicsObject):
         # Rotate along velocity
         self.angle = atan2(*self.vel[::-1]) + pi
 
-        last_center = self.rect.center
-        super().update(world, window.delta_time)
-
-        # Hurt entities
-        for entity in world.loaded_entities:
-            if (not (entity is self or entity is self.owner)) and isinstance(entity, LivingEntity) and entity.rect.collide_line(self.rect.center, last_center):
-                damage, attack_speed, weapon_range, crit_chance = self.bow.get_weapon_stat_increase(world)
-                damage *= 1 + 0.5 * (crit_chance > random.random())
-                entity.damage(window, damage, Vec(*self.vel).normalized)
-
-                self.bow.apply_attributes(window, self.owner, entity)
-                self.explode(window, world)
-                world.entities.discard(self)
-                world.loaded_entities.discard(self)
-                break
-
     def explode(self, window, world):
         explosive = self.bow.attributes.get("explosive", 0)
         if explosive:
             explosion_damage = self.bow.damage * explosive * ATTRIBUTE_BASE_MODIFIERS["explosive"] * 0.01
             particle.explosion(window, *self.rect.center, size=2.0, time=0.5)
-            world.entities.discard(self)
+            world.remove_entity(self)
             sound.play(window, "explosion", (self.rect.x - world.player.rect.x) / 10)
 
-            for entity in world.loaded_entities:
+            for entity in world.entity_index.query_radius(self.rect.center, 3):
                 if entity.type in ("enemy", "player"):
                     distance = dist(entity.rect.center, self.rect.center)
                     if distance < 3:
@@ -1,14 +1,59 @@
 # -*- coding: utf-8 -*-
 from scripts.utility.const import *
 from scripts.utility import file
+import hashlib
+import struct
+import json
+import mmap
+
+
+# Compiled structures are cached in a single file: header, metadata (json), arrays
+# The cache is valid for one set of structure files and block indices.
+CACHE_MAGIC = b"LHSC"
+CACHE_HEADER = struct.Struct("<4s20sQ") # Magic, key, metadata length
+
+loaded_cache: tuple = (None, None) # (key, structures) of the last loaded cache
 
 
 def load(block_name):
     """
-    Load structures from files.
+    Load structures from the structure cache.
+    The structures are compiled again when the structure files or block indices changed.
+    """
+    global loaded_cache
+
+    structure_paths: list = sorted(file.find("data/structures", "*.json", True))
+    key = get_cache_key(block_name, structure_paths)
+
+    if loaded_cache[0] != key:
+        structures = read_cache(STRUCTURE_CACHE_PATH, key)
+        if structures is None:
+            structures = compile_structures(block_name, structure_paths)
+            try:
+                write_cache(STRUCTURE_CACHE_PATH, key, structures)
+            except OSError as e: # Cache is not writable
+                print(e)
+        loaded_cache = (key, structures)
+
+    return dict(loaded_cache[1])
+
+
+def get_cache_key(block_name, structure_paths):
+    """
+    Returns a hash of the block indices and the structure files.
+    """
+    key = hashlib.sha1(json.dumps(sorted(block_name.items())).encode())
+    for path in structure_paths:
+        for structure_file in (path, path.replace("json", "npy")):
+            with open(file.abspath(structure_file), "rb") as f:
+                key.update(f.read())
+    return key.digest()
+
+
+def compile_structures(block_name, structure_paths):
+    """
+    Load structures from files, adjust their block indices and find the size of entrances and exits.
     """
-    # Find structure files
-    structure_paths: list = file.find("data/structures", "*.json", True)
     structures: dict = {}
 
     for path in structure_paths:
@@ -16,15 +61,12 @@ def load(block_name):
         array = file.load(path.replace("json", "npy"), file_format="numpy")
 
         # Adjust block indices (if they changed due to recently added blocks)
-        for x, y, z in numpy.ndindex((*array.shape[:2], 3)):
-            index = array[x, y, z]
-
-            if index == 0:
-                block = 0 # Air
-            else:
-                block = block_name[data["block_indices"][str(index)]]
-
-            array[x, y, z] = block
+        indices = numpy.unique(array[:, :, :3]).tolist()
+        remap = numpy.zeros(indices[-1] + 1, dtype=WORLD_CHUNK_DTYPE) # 0: Air
+        for index in indices[1:] if indices[0] == 0 else indices:
+            remap[index] = block_name[data["block_indices"][str(index)]]
+        array = array.astype(WORLD_CHUNK_DTYPE)
+        array[:, :, :3] = remap[array[:, :, :3]]
 
         name = data["name"]
         del data["name"]
@@ -59,6 +101,63 @@ def load(block_name):
     return structures
 
 
+def write_cache(path: str, key: bytes, structures: dict):
+    """
+    Write compiled structures into a cache file.
+    """
+    path = file.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    metadata = {}
+    arrays = []
+    offset = 0
+    for name, data in structures.items():
+        array = numpy.ascontiguousarray(data["array"])
+        metadata[name] = {**{k: v for k, v in data.items() if k != "array"}, "array": [offset, list(array.shape)]}
+        arrays.append(array.tobytes())
+        offset += array.nbytes
+    metadata = json.dumps(metadata).encode()
+    metadata += b" " * (-(CACHE_HEADER.size + len(metadata)) % 8) # Align arrays
+
+    temporary_path = f"{path}.{os.getpid()}.tmp" # The pool process may write the cache at the same time
+    with open(temporary_path, "wb") as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, key, len(metadata)))
+        f.write(metadata)
+        f.write(b"".join(arrays))
+    os.replace(temporary_path, path)
+
+
+def read_cache(path: str, key: bytes):
+    """
+    Returns the structures of a cache file or None if it does not exist or is outdated.
+    The arrays are memory mapped and read-only.
+    """
+    path = file.abspath(path)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty file
+            return None
+
+    if len(data) < CACHE_HEADER.size:
+        return None
+    magic, cache_key, metadata_length = CACHE_HEADER.unpack_from(data, 0)
+    if magic != CACHE_MAGIC or cache_key != key:
+        data.close()
+        return None
+
+    structures = json.loads(data[CACHE_HEADER.size:CACHE_HEADER.size + metadata_length])
+    arrays_offset = CACHE_HEADER.size + metadata_length
+    for structure_data in structures.values():
+        offset, shape = structure_data["array"]
+        structure_data["array"] = numpy.frombuffer(data, dtype=WORLD_CHUNK_DTYPE, count=int(numpy.prod(shape)), offset=arrays_offset + offset).reshape(shape)
+
+    return structures
+
+
 def find_cave_wall(array, start, angle):
     width, height = array.shape[:2]
     x, y = start
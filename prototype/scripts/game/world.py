@@ -1,20 +1,55 @@
 # -*- coding: utf-8 -*-
-from scripts.game.world_generation import generate_world
+from scripts.game.world_generation import generate_world, generate_chunks, extend_caves
+from scripts.game.entity import ENEMY_KINDS, ENEMY_WEAPONS
 from scripts.graphics import particle
-from scripts.utility import geometry
+from scripts.utility.spatial_hash import SpatialHash
+from scripts.game.physics import PhysicsWorld
+from scripts.utility.thread import threaded
+from scripts.utility.geometry import Rect
 from scripts.utility.const import *
+from scripts.utility import world_file
 from scripts.graphics import sound
 from scripts.utility import file
 from scripts.game import player
+import multiprocessing
+import collections
+import threading
+import pickle
+import json
 import time
 
 
 class World:
     def __init__(self, block_data, block_generation_properties, block_group_size, block_properties):
-        self.view: numpy.array = None # Sent to shader to render
+        self.view: numpy.array = None # Ring buffer sent to shader to render
         self.view_size: tuple = (0, 0)
-        self.chunks = {} # {(chunk_x, chunk_y): numpy_array(16x16x4)} -> (block, plant, background, water_level)
-        self.camera_stop: int = 0 # maximum camera x
+        self.view_start: tuple = (0, 0) # Block coordinate of the first visible block
+        self.view_dirty: set = set() # Positions in the view of changed blocks
+        self.view_updates: list = [] # Rectangles of the view, which have to be sent to the shader
+        self.chunks = {} # {(chunk_x, chunk_y): numpy_array(32x32x4, int16)} -> (block, plant, background, water_level)
+        self.world_file: world_file.WorldFile = None # Chunks which are not in self.chunks are decoded from here
+        self.world_file_remap: numpy.ndarray = None # Block indices of the world file -> current block indices
+        self.world_file_lock: threading.RLock = threading.RLock()
+        self.save_id: int = 0 # Journal records are only applied to the world file with the same save id
+        self.dirty_chunks: set = set() # Chunks changed since the last autosave
+        self.journaled_chunks: set = set() # Chunks which are newer in the journal than in the world file
+        self.scratch_file: world_file.ScratchFile = world_file.ScratchFile() # Changed chunks, which were removed from memory
+        self.filled_chunks: set = set() # Chunks filled with dirt, which were removed from memory
+        self.chunk_access: dict = {} # {(chunk_x, chunk_y): chunk_tick} of the last access of chunks in memory
+        self.chunk_tick: int = 0 # Counts world updates
+        self.autosave_timer: float = 0.0
+        self.autosave_data: tuple = None # Data of the running autosave
+        self.seed: float = 0.0
+        self.chunk_stages: dict = {} # {(chunk_x, chunk_y): generation stage} of chunks which are not generated completely
+        self.generated_chunk_x: int = None # Chunk columns left of this are generated completely
+        self.generation_lock: threading.RLock = threading.RLock() # Held while chunks are generated in the background
+        self.generation_thread: int = None # Identifier of the thread generating in the background
+        self.generated_changes: collections.deque = collections.deque() # ("chunk", coord) or ("entity", entity) of background generation, applied on the main thread
+        self.cave_stream: dict = None # State of the cave generation, None when the goal was generated
+        self.structures: dict = None # Structures placed by the cave generation, loaded when it is continued
+        self.camera_stop: float = 0 # maximum camera x
+        self.enemy_stop: float = 0 # maximum x of spawned enemies
+        self.spare: bool = False # Generated in advance for the world pool
         self.item_count: int = 0
         os.environ["item_count"] = "0"
 
@@ -48,14 +83,40 @@ class World:
         }
         self.block_family["air"] = "air"
         self.block_index[0] = "air"
+        if max(self.block_index) > numpy.iinfo(WORLD_CHUNK_DTYPE).max:
+            raise Exception("Block indices do not fit into the chunk data type " + WORLD_CHUNK_DTYPE)
         self.block_group_size = block_group_size
-        self.blocks_climbable: set = {self.block_name[name] for name in BLOCKS_CLIMBABLE}
+        self.decoration_index: dict = {} # {(side, block name, water, corner): (decoration blocks, cumulative weights)}
+
+        # Block properties indexed by block index, so that arrays of blocks can be looked up at once
+        block_count = max(self.block_index) + 1
+        self.block_families: tuple = tuple(sorted(set(self.block_family.values()))) # Family id -> family name
+        self.block_family_id: numpy.ndarray = numpy.zeros(block_count, dtype=numpy.int16)
+        self.block_layers: numpy.ndarray = numpy.zeros(block_count, dtype=numpy.int8) # Layer of the chunk in which the block is stored
+        for index, name in self.block_index.items():
+            self.block_family_id[index] = self.block_families.index(self.block_family[name])
+            self.block_layers[index] = self.block_layer.get(name, 0)
+        self.block_solid: numpy.ndarray = (self.block_layers == 0) & (numpy.arange(block_count) != 0)
+        self.block_friction: numpy.ndarray = numpy.full(block_count, BLOCKS_DEFAULT_FRICTION, dtype=numpy.float32)
+        for index, properties in block_properties.items():
+            if isinstance(index, int):
+                self.block_friction[index] = properties["friction"]
+        self.block_climbable: numpy.ndarray = numpy.zeros(block_count, dtype=bool)
+        self.block_climbable[[self.block_name[name] for name in BLOCKS_CLIMBABLE]] = True
+        self.block_light: numpy.ndarray = numpy.zeros(block_count, dtype=bool)
+        self.block_light[[self.block_name[name] for name in BLOCKS_LIGHT]] = True
 
         self.entities: set = set()
         self.loaded_entities: set = set()
+        self.entity_index: SpatialHash = SpatialHash(WORLD_ENTITY_CELL_SIZE) # Positions of all entities
+        self.enemies: set = set() # Enemies, which are stored as spawn records when they are far away
+        self.spawn_records: dict = {} # {(chunk_x, chunk_y): array (n x 4) of x, y, enemy kind, weapon (-1: random)} of enemies, which are created when reached
+        self.physics: PhysicsWorld = PhysicsWorld() # Moves the loaded entities
         self.wind: float = 0.0 # Wind direction
         self.loaded_blocks: tuple = ((0, 0), (0, 0)) # (start, end)
         self.water_update_timer: float = 0.0
+        self.active_chunks: set = set() # Chunks in which water can move
+        self.torches: set = set() # Coordinates of lit torches
         self.entity_water_obstructions: set = set()
 
         if PHYSICS_REALISTIC:
@@ -65,30 +126,153 @@ class World:
         self.add_entity(self.player)
 
     def iterate(self):
-        for chunk_x, chunk_y in self.chunks:
+        for chunk_x, chunk_y in tuple(self.chunks):
             for delta_x, delta_y in numpy.ndindex((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE)):
                 yield chunk_x * WORLD_CHUNK_SIZE + delta_x, chunk_y * WORLD_CHUNK_SIZE + delta_y
 
     def get_block_friction(self, block_type: int):
-        properties = self.block_properties.get(block_type, 0)
-        if properties:
-            return properties["friction"]
-        return 0.1
+        return float(self.block_friction[block_type])
 
     def add_entity(self, entity):
+        if self.get_generating_in_background(): # The main thread uses the entities
+            self.generated_changes.append(("entity", entity))
+            return
         self.entities.add(entity)
+        self.entity_index.insert(entity)
+        if type(entity) in ENEMY_KINDS:
+            self.enemies.add(entity)
+
+    def remove_entity(self, entity):
+        self.entities.discard(entity)
+        self.loaded_entities.discard(entity)
+        self.entity_index.remove(entity)
+        self.enemies.discard(entity)
+
+    def add_spawns(self, spawns):
+        """
+        Add spawn records (n x 4 array of x, y, enemy kind, weapon) to the spawn records of their chunks.
+        """
+        chunks = numpy.floor(spawns[:, :2]).astype(int) >> WORLD_CHUNK_SIZE_POWER
+        for chunk_x, chunk_y in numpy.unique(chunks, axis=0).tolist():
+            chunk_spawns = spawns[(chunks[:, 0] == chunk_x) & (chunks[:, 1] == chunk_y)]
+            if (chunk_x, chunk_y) in self.spawn_records:
+                chunk_spawns = numpy.concatenate((self.spawn_records[(chunk_x, chunk_y)], chunk_spawns))
+            self.spawn_records[(chunk_x, chunk_y)] = chunk_spawns
+
+    def update_spawns(self):
+        """
+        Create the enemies of the spawn records of chunks within the loaded blocks.
+        Enemies further than WORLD_SPAWN_DISTANCE chunks away are stored as spawn records again.
+        Damaged or stunned enemies are kept, as spawn records do not store their state.
+        """
+        if not self.generation_lock.acquire(blocking=False): # Generation adds spawn records
+            return
+        try:
+            (start_x, start_y), (end_x, end_y) = self.loaded_blocks
+            start_chunk_x, start_chunk_y = start_x >> WORLD_CHUNK_SIZE_POWER, start_y >> WORLD_CHUNK_SIZE_POWER
+            end_chunk_x, end_chunk_y = (end_x - 1) >> WORLD_CHUNK_SIZE_POWER, (end_y - 1) >> WORLD_CHUNK_SIZE_POWER
+
+            # Store enemies far away
+            spawns = []
+            for entity in tuple(self.enemies):
+                chunk_x, chunk_y = floor(entity.rect.x) >> WORLD_CHUNK_SIZE_POWER, floor(entity.rect.y) >> WORLD_CHUNK_SIZE_POWER
+                if entity.health < entity.max_health or entity.stunned:
+                    continue
+                if not (
+                    start_chunk_x - WORLD_SPAWN_DISTANCE <= chunk_x <= end_chunk_x + WORLD_SPAWN_DISTANCE and
+                    start_chunk_y - WORLD_SPAWN_DISTANCE <= chunk_y <= end_chunk_y + WORLD_SPAWN_DISTANCE
+                ):
+                    weapon = -1 if entity.holding is None else ENEMY_WEAPONS.index(type(entity.holding))
+                    spawns.append((entity.rect.x, entity.rect.y, ENEMY_KINDS.index(type(entity)), weapon))
+                    self.remove_entity(entity)
+            if spawns:
+                self.add_spawns(numpy.array(spawns, dtype=WORLD_SPAWN_DTYPE))
+
+            # Create enemies of the loaded chunks
+            for chunk_x in range(start_chunk_x, end_chunk_x + 1):
+                for chunk_y in range(start_chunk_y, end_chunk_y + 1):
+                    if (chunk_x, chunk_y) in self.spawn_records:
+                        for x, y, kind, weapon in self.spawn_records.pop((chunk_x, chunk_y)).tolist():
+                            if weapon < 0:
+                                self.add_entity(ENEMY_KINDS[int(kind)]((x, y)))
+                            else:
+                                self.add_entity(ENEMY_KINDS[int(kind)]((x, y), weapon=ENEMY_WEAPONS[int(weapon)]))
+        finally:
+            self.generation_lock.release()
 
     def create_chunk(self, x: int, y: int):
-        self.chunks[(x, y)] = numpy.zeros((32, 32, 4))
-        self.chunks[(x, y)][:, :, 0] = self.block_name["dirt_block"]
+        with self.generation_lock: # Generation in the background adds chunks
+            if (x, y) in self.chunks: # Generated while waiting for the lock
+                return
+            self.chunks[(x, y)] = self.get_filled_chunk()
+            self.chunk_access[(x, y)] = self.chunk_tick
+            self.dirty_chunks.add((x, y))
+
+    def get_filled_chunk(self):
+        chunk = numpy.zeros((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE, 4), dtype=WORLD_CHUNK_DTYPE)
+        chunk[:, :, 0] = self.block_name["dirt_block"]
+        return chunk
+
+    def load_chunk(self, chunk_x: int, chunk_y: int):
+        """
+        Load a chunk, which is not in memory, from the scratch file or the world file. Returns whether the chunk exists.
+        Waits for generation running in the background, which also loads and adds chunks.
+        """
+        coord = (chunk_x, chunk_y)
+        if not self.get_chunk_exists(chunk_x, chunk_y):
+            return False
+        with self.generation_lock:
+            if coord in self.chunks: # Loaded while waiting for the lock
+                return True
+            if coord in self.scratch_file.chunks:
+                chunk = self.scratch_file.read_chunk(coord)
+            elif coord in self.filled_chunks:
+                chunk = self.get_filled_chunk()
+                self.filled_chunks.discard(coord)
+            elif not self.world_file is None and coord in self.world_file.chunks:
+                chunk = self.read_world_file_chunk(coord)
+            else:
+                return False
+
+            self.chunks[coord] = chunk
+            self.chunk_access[coord] = self.chunk_tick
+            self.find_torches(chunk_x, chunk_y)
+            return True
+
+    def read_world_file_chunk(self, coord: tuple):
+        chunk = self.world_file.read_chunk(coord)
+        if not self.world_file_remap is None:
+            chunk[:, :, :3] = self.world_file_remap[chunk[:, :, :3]]
+        return chunk
+
+    def find_torches(self, chunk_x: int, chunk_y: int):
+        for delta_x, delta_y in numpy.argwhere(self.block_light[self.chunks[(chunk_x, chunk_y)][:, :, 1]]).tolist():
+            self.torches.add((chunk_x * WORLD_CHUNK_SIZE + delta_x, chunk_y * WORLD_CHUNK_SIZE + delta_y))
 
     def get_block_exists(self, x: int, y: int):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
         chunk_y = y >> WORLD_CHUNK_SIZE_POWER
-        return (chunk_x, chunk_y) in self.chunks
+        return self.get_chunk_exists(chunk_x, chunk_y)
 
     def get_chunk_exists(self, chunk_x: int, chunk_y: int):
-        return (chunk_x, chunk_y) in self.chunks
+        coord = (chunk_x, chunk_y)
+        return (
+            coord in self.chunks or coord in self.scratch_file.chunks or coord in self.filled_chunks or
+            (not self.world_file is None and coord in self.world_file.chunks)
+        )
+
+    def get_chunk_coords(self, start_chunk_x: int, end_chunk_x: int):
+        """
+        Returns the sorted coordinates of all chunks from start_chunk_x to end_chunk_x (excluded).
+        Chunks which are not in memory are loaded.
+        """
+        coords = {coord for coord in tuple(self.chunks) if start_chunk_x <= coord[0] < end_chunk_x}
+        for stored_coords in (tuple(self.scratch_file.chunks), tuple(self.filled_chunks), () if self.world_file is None else self.world_file.chunks):
+            for coord in stored_coords:
+                if start_chunk_x <= coord[0] < end_chunk_x and not coord in coords:
+                    self.load_chunk(*coord)
+                    coords.add(coord)
+        return sorted(coords)
 
     def set_block(self, x: int, y: int, data: int, layer=0):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
@@ -96,11 +280,21 @@ class World:
         mod_x = x & (WORLD_CHUNK_SIZE - 1)
         mod_y = y & (WORLD_CHUNK_SIZE - 1)
 
-        if not (chunk_x, chunk_y) in self.chunks:
+        if not (chunk_x, chunk_y) in self.chunks and not self.load_chunk(chunk_x, chunk_y):
             self.create_chunk(chunk_x, chunk_y)
-        if isinstance(data, (int, float)) and data:
-            layer = self.block_layer[self.block_index[data]]
-        self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, layer] = data
+        if isinstance(data, (int, float, numpy.integer)) and data:
+            layer = int(self.block_layers[int(data)])
+        chunk = self.chunks[(chunk_x, chunk_y)]
+        chunk[mod_x, mod_y, layer] = data
+        self.active_chunks.add((chunk_x, chunk_y))
+        self.dirty_chunks.add((chunk_x, chunk_y))
+        self.update_view_block(x, y)
+
+        if layer != 0: # Plant layer might have changed
+            if self.block_light[chunk[mod_x, mod_y, 1]]:
+                self.torches.add((x, y))
+            else:
+                self.torches.discard((x, y))
     
     def get_block(self, x: int, y: int, layer: int=0, generate: bool=False, default: int=(0, 0, 0, 0)):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
@@ -108,7 +302,7 @@ class World:
         mod_x = x & (WORLD_CHUNK_SIZE - 1)
         mod_y = y & (WORLD_CHUNK_SIZE - 1)
 
-        if not (chunk_x, chunk_y) in self.chunks:
+        if not (chunk_x, chunk_y) in self.chunks and not self.load_chunk(chunk_x, chunk_y):
             if generate:
                 self.create_chunk(chunk_x, chunk_y)
             else:
@@ -117,46 +311,150 @@ class World:
                 return default
         return self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, layer]
 
+    def get_blocks(self, x, y, layer: int=0):
+        """
+        Returns the blocks of one layer at the coordinates of the integer arrays x and y at once.
+        Blocks of chunks which do not exist are 0.
+        """
+        x, y = numpy.broadcast_arrays(x, y)
+        blocks = numpy.zeros(x.shape, dtype=WORLD_CHUNK_DTYPE)
+        chunk_x = x >> WORLD_CHUNK_SIZE_POWER
+        chunk_y = y >> WORLD_CHUNK_SIZE_POWER
+
+        for coord in map(tuple, numpy.unique(numpy.stack((chunk_x.ravel(), chunk_y.ravel()), axis=1), axis=0).tolist()):
+            if not coord in self.chunks and not self.load_chunk(*coord):
+                continue
+            mask = (chunk_x == coord[0]) & (chunk_y == coord[1])
+            blocks[mask] = self.chunks[coord][x[mask] & (WORLD_CHUNK_SIZE - 1), y[mask] & (WORLD_CHUNK_SIZE - 1), layer]
+        return blocks
+
+    def blit(self, x: int, y: int, array, layers=slice(None), mask=None):
+        """
+        Write an area of blocks at once. Chunks are created if needed.
+        array: blocks (width x height) of one layer or (width x height x layers) of a slice of layers
+        mask: only blocks where the mask (width x height) is set are written
+        """
+        width, height = array.shape[:2]
+        if mask is None:
+            mask = numpy.ones((width, height), dtype=bool)
+        plant_layer = layers == 1 if isinstance(layers, int) else 1 in range(4)[layers]
+        generating_in_background = self.get_generating_in_background()
+
+        for chunk_x in range(x >> WORLD_CHUNK_SIZE_POWER, ((x + width - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+            for chunk_y in range(y >> WORLD_CHUNK_SIZE_POWER, ((y + height - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+                copy_start_x = max(x, chunk_x * WORLD_CHUNK_SIZE)
+                copy_start_y = max(y, chunk_y * WORLD_CHUNK_SIZE)
+                copy_end_x = min(x + width, (chunk_x + 1) * WORLD_CHUNK_SIZE)
+                copy_end_y = min(y + height, (chunk_y + 1) * WORLD_CHUNK_SIZE)
+                mod_x = copy_start_x & (WORLD_CHUNK_SIZE - 1)
+                mod_y = copy_start_y & (WORLD_CHUNK_SIZE - 1)
+                piece = (slice(copy_start_x - x, copy_end_x - x), slice(copy_start_y - y, copy_end_y - y))
+                piece_mask = mask[piece]
+                if not piece_mask.any():
+                    continue
+
+                if not (chunk_x, chunk_y) in self.chunks and not self.load_chunk(chunk_x, chunk_y):
+                    self.create_chunk(chunk_x, chunk_y)
+                chunk_area = self.chunks[(chunk_x, chunk_y)][mod_x:mod_x + copy_end_x - copy_start_x, mod_y:mod_y + copy_end_y - copy_start_y]
+                chunk_area[:, :, layers][piece_mask] = array[piece][piece_mask]
+                self.active_chunks.add((chunk_x, chunk_y))
+                self.dirty_chunks.add((chunk_x, chunk_y))
+                if generating_in_background: # The main thread copies the chunk into the view
+                    self.generated_changes.append(("chunk", (chunk_x, chunk_y)))
+
+                if plant_layer: # Torches might have changed
+                    for torch_x, torch_y in tuple(self.torches):
+                        if copy_start_x <= torch_x < copy_end_x and copy_start_y <= torch_y < copy_end_y and piece_mask[torch_x - copy_start_x, torch_y - copy_start_y]:
+                            self.torches.discard((torch_x, torch_y))
+                    for delta_x, delta_y in numpy.argwhere(piece_mask & self.block_light[chunk_area[:, :, 1]]).tolist():
+                        self.torches.add((copy_start_x + delta_x, copy_start_y + delta_y))
+
+        # Copy visible blocks into the view
+        if self.view is None or generating_in_background:
+            return
+        start_x, start_y = max(x, self.view_start[0]), max(y, self.view_start[1])
+        end_x, end_y = min(x + width, self.view_start[0] + self.view_size[0]), min(y + height, self.view_start[1] + self.view_size[1])
+        if start_x >= end_x or start_y >= end_y:
+            return
+        index_x, index_y = self.get_view_index((start_x, start_y), (end_x, end_y))
+        changed_x, changed_y = numpy.nonzero(mask[start_x - x:end_x - x, start_y - y:end_y - y])
+        index_x, index_y = index_x[changed_x, 0], index_y[0, changed_y]
+        self.view[index_x, index_y, layers] = array[changed_x + start_x - x, changed_y + start_y - y]
+        self.view_dirty.update(zip(index_x.tolist(), index_y.tolist()))
+
+    def read_region(self, start_x: int, start_y: int, end_x: int, end_y: int, layers=slice(None), default: int=0):
+        """
+        Returns the blocks of an area (end excluded) at once.
+        Blocks of chunks which do not exist are set to default.
+        """
+        region = numpy.full((end_x - start_x, end_y - start_y, 4), default, dtype=WORLD_CHUNK_DTYPE)[:, :, layers]
+
+        for chunk_x in range(start_x >> WORLD_CHUNK_SIZE_POWER, ((end_x - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+            for chunk_y in range(start_y >> WORLD_CHUNK_SIZE_POWER, ((end_y - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+                if not (chunk_x, chunk_y) in self.chunks and not self.load_chunk(chunk_x, chunk_y):
+                    continue
+                copy_start_x = max(start_x, chunk_x * WORLD_CHUNK_SIZE)
+                copy_start_y = max(start_y, chunk_y * WORLD_CHUNK_SIZE)
+                copy_end_x = min(end_x, (chunk_x + 1) * WORLD_CHUNK_SIZE)
+                copy_end_y = min(end_y, (chunk_y + 1) * WORLD_CHUNK_SIZE)
+                mod_x = copy_start_x & (WORLD_CHUNK_SIZE - 1)
+                mod_y = copy_start_y & (WORLD_CHUNK_SIZE - 1)
+
+                region[copy_start_x - start_x:copy_end_x - start_x, copy_start_y - start_y:copy_end_y - start_y] = self.chunks[(chunk_x, chunk_y)][mod_x:mod_x + copy_end_x - copy_start_x, mod_y:mod_y + copy_end_y - copy_start_y, layers]
+
+        return region
+
     def set_water(self, x, y, level):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
         chunk_y = y >> WORLD_CHUNK_SIZE_POWER
         mod_x = x & (WORLD_CHUNK_SIZE - 1)
         mod_y = y & (WORLD_CHUNK_SIZE - 1)
 
-        if not (chunk_x, chunk_y) in self.chunks:
+        if not (chunk_x, chunk_y) in self.chunks and not self.load_chunk(chunk_x, chunk_y):
             self.create_chunk(chunk_x, chunk_y)
-        self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3] = int(level)
+        self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3] = max(-WORLD_WATER_LIMIT, min(WORLD_WATER_LIMIT, int(level)))
+        self.active_chunks.add((chunk_x, chunk_y))
+        self.dirty_chunks.add((chunk_x, chunk_y))
+        self.update_view_block(x, y)
 
     def get_water(self, x, y):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
         chunk_y = y >> WORLD_CHUNK_SIZE_POWER
 
-        if not (chunk_x, chunk_y) in self.chunks:
+        if not (chunk_x, chunk_y) in self.chunks and not self.load_chunk(chunk_x, chunk_y):
             return 0
 
         mod_x = x & (WORLD_CHUNK_SIZE - 1)
         mod_y = y & (WORLD_CHUNK_SIZE - 1)
-        return abs(self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3])
+        return abs(int(self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3]))
 
     def get_water_side(self, x, y):
         chunk_x = x >> WORLD_CHUNK_SIZE_POWER
         chunk_y = y >> WORLD_CHUNK_SIZE_POWER
 
-        if not (chunk_x, chunk_y) in self.chunks:
+        if not (chunk_x, chunk_y) in self.chunks and not self.load_chunk(chunk_x, chunk_y):
             return 1
 
         mod_x = x & (WORLD_CHUNK_SIZE - 1)
         mod_y = y & (WORLD_CHUNK_SIZE - 1)
 
-        return copysign(1, abs(self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3]))
+        return copysign(1, abs(int(self.chunks[(chunk_x, chunk_y)][mod_x, mod_y, 3])))
 
     def update_physics(self, window):
-        for entity in self.loaded_entities.copy():
+        loaded_entities = self.loaded_entities.copy()
+        for entity in loaded_entities:
             if entity.health <= 0 and not entity is self.player:
                 self.player.obtain_weapon_drop(window, entity)
-                self.entities.discard(entity)
-                self.loaded_entities.discard(entity)
+                self.remove_entity(entity)
+
+        # Move all loaded entities at once, before they react to their new positions
+        self.physics.step(self, [entity for entity in self.loaded_entities if entity.get_moving()], window.delta_time)
+        for entity in self.physics.get_entered_water():
+            entity.hit_water(self, window)
+
+        for entity in loaded_entities:
             entity.update(self, window)
+            self.entity_index.move(entity)
 
         if window.options["particles"]:
             particle.update(window)
@@ -167,18 +465,31 @@ class World:
             return
         delta_time = self.delta_time
         self.delta_time = 0
+        self.apply_generated_changes()
+        self.autosave(window, delta_time)
 
-        # Filter entites
+        # Generate chunks ahead of the loaded blocks
+        end_chunk_x = (self.loaded_blocks[1][0] >> WORLD_CHUNK_SIZE_POWER) + 1 + WORLD_GENERATION_DISTANCE
+        if (self.chunk_stages or self.cave_stream) and (self.generated_chunk_x is None or end_chunk_x > self.generated_chunk_x):
+            threaded(self.generate_in_background, end_chunk_x)
+
+        # Chunks of the loaded blocks are kept in memory
         (start_x, start_y), (end_x, end_y) = self.loaded_blocks
-        self.loaded_entities.clear()
+        self.chunk_tick += 1
+        for chunk_x in range((start_x >> WORLD_CHUNK_SIZE_POWER) - 1, (end_x >> WORLD_CHUNK_SIZE_POWER) + 2):
+            for chunk_y in range((start_y >> WORLD_CHUNK_SIZE_POWER) - 1, (end_y >> WORLD_CHUNK_SIZE_POWER) + 2):
+                if (chunk_x, chunk_y) in self.chunks:
+                    self.chunk_access[(chunk_x, chunk_y)] = self.chunk_tick
+        self.evict_chunks()
+
+        # Filter entites, only loaded entities move
+        self.update_spawns()
+        last_loaded_entities = self.loaded_entities
+        self.loaded_entities = self.entity_index.query_rect(Rect(start_x, start_y, end_x - start_x, end_y - start_y))
         self.loaded_entities.add(self.player)
-        #self.entity_water_obstructions.clear()
-        for entity in self.entities.copy():
-            if start_x < entity.rect.x < end_x and start_y < entity.rect.y < end_y:
-                self.loaded_entities.add(entity)
-                #self.entity_water_obstructions.add((round(entity.rect.centerx), floor(entity.rect.centery)))
-            elif entity.destroy_unloaded:
-                self.entities.discard(entity)
+        for entity in last_loaded_entities - self.loaded_entities:
+            if entity.destroy_unloaded:
+                self.remove_entity(entity)
         
         # Update wind
         self.wind = sin(window.time) * WORLD_WIND_STRENGTH + cos(window.time * 5) * WORLD_WIND_STRENGTH / 2
@@ -191,9 +502,13 @@ class World:
             sound.play(window, "cave_ambient", x=random.random() * 2 - 1)
 
         # Update water
-        for y in geometry.shuffled_range(self.view_size[1] - 1):
-            for x in geometry.shuffled_range(self.view_size[0] - 1):
-                self.update_block(window, self.loaded_blocks[0][0] + x, self.loaded_blocks[0][1] + y)
+        for active_area in self.get_active_areas():
+            self.update_water(*active_area)
+
+        # Update torches
+        for x, y in tuple(self.torches):
+            if start_x <= x < end_x and start_y <= y < end_y:
+                self.update_block(window, x, y)
 
         # Update particles
         if window.options["particles"]:
@@ -216,136 +531,327 @@ class World:
     def update_block(self, window, x, y):
         block_array = self.get_block(x, y, layer=slice(None), generate=True)
 
-        # Update water
-        self.update_block_water(window, x, y)
-
         # Update torches
-        if self.block_index[block_array[1]] in ("torch", "torch_flipped"):
+        if self.block_light[block_array[1]]:
             particle.spawn(window, "fire_particle", x + 0.5, y + 0.7)
             if block_array[3] > 600:
                 self.set_block(x, y, self.block_name["unlit_torch"])
 
-    def update_block_water(self, window, x, y):
-        water_level = self.get_water(x, y)
-        if not water_level:
+    def generate(self, end_chunk_x: int):
+        """
+        Run the pending generation stages of all chunks left of end_chunk_x.
+        Waits for generation running in the background.
+        """
+        if not (self.chunk_stages or self.cave_stream) or (not self.generated_chunk_x is None and end_chunk_x <= self.generated_chunk_x):
+            return
+        with self.generation_lock:
+            if self.generated_chunk_x is None or end_chunk_x > self.generated_chunk_x:
+                # The stages of a column need the next columns, which are extended first
+                extend_caves(self, end_chunk_x + WORLD_STAGE_POPULATED - WORLD_STAGE_TERRAIN)
+                generate_chunks(self, end_chunk_x)
+                self.generated_chunk_x = end_chunk_x
+
+    def generate_in_background(self, end_chunk_x: int):
+        """
+        Run generate on a background thread.
+        The generation only changes chunks and spawn records, changes of the view and the entities are applied on the main thread.
+        """
+        with self.generation_lock:
+            self.generation_thread = threading.get_ident()
+            try:
+                self.generate(end_chunk_x)
+            finally:
+                self.generation_thread = None
+
+    def get_generating_in_background(self):
+        return self.generation_thread == threading.get_ident()
+
+    def apply_generated_changes(self):
+        """
+        Copy the chunks changed by the background generation into the view and add the generated entities.
+        Called from the main thread.
+        """
+        changed_chunks = set()
+        while self.generated_changes:
+            kind, data = self.generated_changes.popleft()
+            if kind == "entity":
+                self.add_entity(data)
+            else:
+                changed_chunks.add(data)
+        if self.view is None:
             return
 
-        emmitable_water = min(water_level / 2, WORLD_WATER_PER_BLOCK / 2)
-        overflow_water = max(0, water_level - WORLD_WATER_PER_BLOCK) / 4
-        water_side = self.get_water_side(x, y)
-
-        if self.get_water(x, y + 1):
-            water_side = self.get_water_side(x, y + 1)
-
-        # Block below
-        if not self.get_block(x, y - 1):
-            water_level_below = self.get_water(x, y - 1)
-            absorbable_water = max(0, WORLD_WATER_PER_BLOCK - water_level_below + overflow_water)
-
-            absorbed_water = min(absorbable_water, emmitable_water)
-            water_level -= absorbed_water
-            emmitable_water -= absorbed_water
-            water_level_below += absorbed_water
+        (view_start_x, view_start_y), (width, height) = self.view_start, self.view_size
+        for chunk_x, chunk_y in changed_chunks:
+            start_x, start_y = max(view_start_x, chunk_x * WORLD_CHUNK_SIZE), max(view_start_y, chunk_y * WORLD_CHUNK_SIZE)
+            end_x, end_y = min(view_start_x + width, (chunk_x + 1) * WORLD_CHUNK_SIZE), min(view_start_y + height, (chunk_y + 1) * WORLD_CHUNK_SIZE)
+            if start_x < end_x and start_y < end_y:
+                self.copy_to_view(start_x, start_y, end_x, end_y)
+
+    def evict_chunks(self):
+        """
+        Remove the least recently used chunks from memory, if the chunks exceed WORLD_CHUNK_MEMORY_LIMIT.
+        Chunks which are stored unchanged in the world file or filled with dirt are dropped, other chunks are moved to the scratch file.
+        They are loaded again when they are accessed.
+        """
+        chunk_limit = WORLD_CHUNK_MEMORY_LIMIT // (WORLD_CHUNK_SIZE ** 2 * 4 * numpy.dtype(WORLD_CHUNK_DTYPE).itemsize)
+        if len(self.chunks) <= chunk_limit or not self.generation_lock.acquire(blocking=False): # Generation uses chunks
+            return
+        try:
+            evicted = set()
+            dirt_block = self.block_name["dirt_block"]
+            for coord in sorted(self.chunks, key=lambda coord: self.chunk_access.get(coord, 0))[:len(self.chunks) - chunk_limit * 3 // 4]:
+                if self.chunk_access.get(coord, 0) == self.chunk_tick: # Loaded blocks
+                    break
+                chunk = self.chunks.pop(coord)
+                self.chunk_access.pop(coord, None)
+                evicted.add(coord)
+
+                if not self.world_file is None and coord in self.world_file.chunks and not (coord in self.dirty_chunks or coord in self.journaled_chunks):
+                    continue
+                if (chunk[:, :, 0] == dirt_block).all() and not chunk[:, :, 1:].any():
+                    self.filled_chunks.add(coord)
+                else:
+                    self.scratch_file.write_chunk(coord, chunk)
+
+            self.active_chunks.difference_update(evicted)
+            self.torches = {(x, y) for x, y in self.torches if not (x >> WORLD_CHUNK_SIZE_POWER, y >> WORLD_CHUNK_SIZE_POWER) in evicted}
+        finally:
+            self.generation_lock.release()
+
+    def get_active_areas(self):
+        """
+        Returns the areas of loaded blocks in which water can move [((start_x, start_y), (end_x, end_y))].
+        Active chunks fall asleep until water in them moves or a block in them is changed.
+        Each active chunk and its adjacent chunks form an area, overlapping areas are merged.
+        """
+        if self.view is None:
+            return []
+        (start_x, start_y), (width, height) = self.view_start, self.view_size
+        start_chunk_x, start_chunk_y = start_x >> WORLD_CHUNK_SIZE_POWER, start_y >> WORLD_CHUNK_SIZE_POWER
+        end_chunk_x, end_chunk_y = (start_x + width - 1) >> WORLD_CHUNK_SIZE_POWER, (start_y + height - 1) >> WORLD_CHUNK_SIZE_POWER
+
+        active_chunks = [
+            (chunk_x, chunk_y) for chunk_x, chunk_y in tuple(self.active_chunks)
+            if start_chunk_x <= chunk_x <= end_chunk_x and start_chunk_y <= chunk_y <= end_chunk_y
+        ]
+        self.active_chunks.difference_update(active_chunks)
+
+        # Water can flow into adjacent chunks (start_chunk_x, start_chunk_y, end_chunk_x, end_chunk_y), end excluded
+        areas = [(chunk_x - 1, chunk_y - 1, chunk_x + 2, chunk_y + 2) for chunk_x, chunk_y in active_chunks]
+        merged = True
+        while merged:
+            merged = False
+            for index, area in enumerate(areas):
+                for other_index in range(index + 1, len(areas)):
+                    other = areas[other_index]
+                    if area[0] < other[2] and other[0] < area[2] and area[1] < other[3] and other[1] < area[3]:
+                        areas[index] = (min(area[0], other[0]), min(area[1], other[1]), max(area[2], other[2]), max(area[3], other[3]))
+                        del areas[other_index]
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        return [
+            (
+                (max(start_x, area_start_x * WORLD_CHUNK_SIZE), max(start_y, area_start_y * WORLD_CHUNK_SIZE)),
+                (min(start_x + width, area_end_x * WORLD_CHUNK_SIZE), min(start_y + height, area_end_y * WORLD_CHUNK_SIZE))
+            )
+            for area_start_x, area_start_y, area_end_x, area_end_y in areas
+        ]
+
+    def update_water(self, start: [int], end: [int]):
+        """
+        Simulate the water of an area of loaded blocks at once.
+        Water falls down, spreads to the sides and is pushed up when a block holds too much water.
+        The sign of the water level is the flow direction (1: left, -1: right).
+        """
+        view = self.get_view_area(start, end)
+        water = numpy.abs(view[:, :, 3]).astype(float)
+        if not water.any():
+            return
 
-            self.set_water(x, y - 1, water_level_below * water_side)
+        water_side = numpy.where(view[:, :, 3] < 0, -1, 1)
+        air = view[:, :, 0] == 0
+
+        for _ in range(WORLD_WATER_STEPS):
+            emmitable_water = numpy.minimum(water / 2, WORLD_WATER_PER_BLOCK / 2)
+            overflow_water = numpy.maximum(0, water - WORLD_WATER_PER_BLOCK) / 4
+
+            # Gravity: flow into the block below
+            absorbable_water = numpy.maximum(0, WORLD_WATER_PER_BLOCK - water[:, :-1] + overflow_water[:, 1:])
+            absorbed_water = numpy.minimum(absorbable_water, emmitable_water[:, 1:]) * air[:, :-1]
+            water[:, 1:] -= absorbed_water
+            water[:, :-1] += absorbed_water
+            emmitable_water[:, 1:] -= absorbed_water
+
+            # Equalization: flow between blocks next to each other (x to x + 1)
+            flow = numpy.clip((water[:-1] - water[1:]) / 3, -emmitable_water[1:] / 2, emmitable_water[:-1] / 2)
+            flow *= numpy.where(flow > 0, air[1:], air[:-1])
+            water[:-1] -= flow
+            water[1:] += flow
+
+            flow_left = numpy.zeros_like(water) # Water received from the right side
+            flow_right = numpy.zeros_like(water) # Water received from the left side
+            flow_left[:-1] = numpy.maximum(0, -flow)
+            flow_right[1:] = numpy.maximum(0, flow)
+            water_side[flow_left > flow_right] = 1
+            water_side[flow_right > flow_left] = -1
+
+            # Pressure: push overflowing water into the block above
+            pushed_water = numpy.maximum(0, water[:, :-1] - WORLD_WATER_PER_BLOCK) * air[:, 1:]
+            water[:, :-1] -= pushed_water
+            water[:, 1:] += pushed_water
+
+        water_side[:, :-1][water[:, 1:] > 0] = 1 # Water below other water
+        water = numpy.minimum(water.astype(int), WORLD_WATER_LIMIT) * water_side
+        changed = water != view[:, :, 3]
+        if changed.any():
+            self.blit(*start, water, 3, changed) # Chunks with moving water stay active
+
+    def get_view_area(self, start: [int], end: [int]):
+        """
+        Returns the blocks of an area inside the ring buffer view without rolling the whole buffer.
+        """
+        return self.view[self.get_view_index(start, end)]
+
+    def get_view_index(self, start: [int], end: [int]):
+        """
+        Returns an index into the ring buffer view for an area of loaded blocks.
+        """
+        origin = self.get_view_origin()
+        width, height = self.view_size
+        return numpy.ix_(
+            (numpy.arange(start[0] - self.view_start[0], end[0] - self.view_start[0]) + origin[0]) % width,
+            (numpy.arange(start[1] - self.view_start[1], end[1] - self.view_start[1]) + origin[1]) % height
+        )
 
-        if not emmitable_water:
-            self.set_water(x, y, water_level * water_side)
+    def create_view(self, window):
+        """
+        Update the ring buffer view sent to the shader.
+        Only blocks which scrolled into view or changed since the last frame are copied.
+        """
+        start, end = self.loaded_blocks
+        view_size = (end[0] - start[0], end[1] - start[1])
+        if not all(view_size):
             return
+        last_start = self.view_start
+        self.view_start = start
 
-        # Blocks on both sides
-        blocks = {(x, y): water_level}
-        total_water = water_level
+        if view_size != self.view_size or window.world_view is not self.view:
+            # Rebuild the whole view
+            self.view_size = view_size
+            self.view = numpy.empty((*view_size, 4), dtype=WORLD_CHUNK_DTYPE)
+            self.view_dirty.clear()
+            self.copy_to_view(start[0], start[1], end[0], end[1])
 
-        for _x, _y in ((x - 1, y), (x + 1, y)):
-            if not (self.get_block(_x, _y) or self.get_block(_x, _y - 1) and self.get_water(_x, _y - 1) > 1):
-                water_level_target = self.get_water(_x, _y)
-                total_water += water_level_target
-                blocks[(_x, _y)] = water_level_target
-
-        max_water = len(blocks) * WORLD_WATER_PER_BLOCK
-        if total_water > max_water:
-            emmitable_water = total_water - max_water
-            total_water = max_water
         else:
-            emmitable_water = 0
-
-        for (_x, _y), old_water_level_target in blocks.items():
-            water_level_target = total_water / len(blocks)
-            water_side = self.get_water_side(_x, _y)
-            
-            if water_level_target > old_water_level_target:
-                if _x < x:
-                    water_side = 1
-                elif _x > x:
-                    water_side = -1
-                else:
-                    if blocks.get((x + 1, y), 1) < blocks.get((x - 1, y), 0):
-                        water_side = 1
-                    else:
-                        water_side = -1
-
-            if self.get_water(_x, _y + 1):
-                water_side = self.get_water_side(_x, _y)
-
-            self.set_water(_x, _y, water_level_target * water_side)
+            # Copy blocks which scrolled into view
+            delta_x = start[0] - last_start[0]
+            delta_y = start[1] - last_start[1]
 
-        # Block above
-        water_side = self.get_water_side(x, y + 1)
-        water_level_target_above = self.get_water(x, y + 1)
-        self.set_water(x, y + 1, (water_level_target_above + emmitable_water) * water_side)
+            if abs(delta_x) >= view_size[0] or abs(delta_y) >= view_size[1]:
+                self.copy_to_view(start[0], start[1], end[0], end[1])
+            else:
+                if delta_x > 0:
+                    self.copy_to_view(end[0] - delta_x, start[1], end[0], end[1])
+                elif delta_x < 0:
+                    self.copy_to_view(start[0], start[1], start[0] - delta_x, end[1])
+                if delta_y > 0:
+                    self.copy_to_view(start[0], end[1] - delta_y, end[0], end[1])
+                elif delta_y < 0:
+                    self.copy_to_view(start[0], start[1], end[0], start[1] - delta_y)
+
+        self.apply_generated_changes()
+
+        # Upload changed blocks row by row
+        rows = {}
+        for buffer_x, buffer_y in self.view_dirty:
+            span = rows.get(buffer_y, (buffer_x, buffer_x))
+            rows[buffer_y] = (min(span[0], buffer_x), max(span[1], buffer_x))
+        for buffer_y, (buffer_start_x, buffer_end_x) in rows.items():
+            self.view_updates.append((buffer_start_x, buffer_y, buffer_end_x - buffer_start_x + 1, 1))
+        self.view_dirty.clear()
+
+        window.world_view = self.view
+        window.world_view_origin = self.get_view_origin()
+        window.world_view_updates.extend(self.view_updates)
+        self.view_updates.clear()
+
+    def get_view_origin(self):
+        """
+        Returns the position of loaded_blocks[0] in the ring buffer view.
+        """
+        return (self.view_start[0] % self.view_size[0], self.view_start[1] % self.view_size[1])
+
+    def get_view(self):
+        """
+        Returns a copy of the view, which starts at loaded_blocks[0].
+        """
+        origin = self.get_view_origin()
+        return numpy.roll(self.view, (-origin[0], -origin[1]), axis=(0, 1))
+
+    def copy_to_view(self, start_x: int, start_y: int, end_x: int, end_y: int):
+        """
+        Copy an area of blocks from the chunks into the ring buffer view.
+        The area must not be larger than the view.
+        """
+        width, height = self.view_size
+
+        # Split the area where the ring buffer wraps around
+        for piece_start_x, piece_end_x in self._view_wrap(start_x, end_x, width):
+            for piece_start_y, piece_end_y in self._view_wrap(start_y, end_y, height):
+                buffer_x = piece_start_x % width
+                buffer_y = piece_start_y % height
+                self.view_updates.append((buffer_x, buffer_y, piece_end_x - piece_start_x, piece_end_y - piece_start_y))
+
+                # Copy each chunk inside the piece
+                for chunk_x in range(piece_start_x >> WORLD_CHUNK_SIZE_POWER, ((piece_end_x - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+                    for chunk_y in range(piece_start_y >> WORLD_CHUNK_SIZE_POWER, ((piece_end_y - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+                        if (chunk_x, chunk_y) in self.chunks or self.load_chunk(chunk_x, chunk_y):
+                            chunk = self.chunks[(chunk_x, chunk_y)]
+                        else: # Shown filled until the chunk is generated or changed
+                            chunk = self.get_filled_chunk()
+
+                        copy_start_x = max(piece_start_x, chunk_x * WORLD_CHUNK_SIZE)
+                        copy_start_y = max(piece_start_y, chunk_y * WORLD_CHUNK_SIZE)
+                        copy_end_x = min(piece_end_x, (chunk_x + 1) * WORLD_CHUNK_SIZE)
+                        copy_end_y = min(piece_end_y, (chunk_y + 1) * WORLD_CHUNK_SIZE)
+                        mod_x = copy_start_x & (WORLD_CHUNK_SIZE - 1)
+                        mod_y = copy_start_y & (WORLD_CHUNK_SIZE - 1)
+                        dest_x = buffer_x + copy_start_x - piece_start_x
+                        dest_y = buffer_y + copy_start_y - piece_start_y
+
+                        self.view[dest_x:dest_x + copy_end_x - copy_start_x, dest_y:dest_y + copy_end_y - copy_start_y] = chunk[mod_x:mod_x + copy_end_x - copy_start_x, mod_y:mod_y + copy_end_y - copy_start_y]
+
+                        # Water entering the simulated area might move again
+                        if chunk[:, :, 3].any():
+                            self.active_chunks.add((chunk_x, chunk_y))
 
-    def create_view(self, window):
-        start, end = self.loaded_blocks
-        self.view_size = (end[0] - start[0], end[1] - start[1])
-
-        start_chunk_x = start[0] >> WORLD_CHUNK_SIZE_POWER
-        start_chunk_y = start[1] >> WORLD_CHUNK_SIZE_POWER
-        start_mod_x = start[0] & (WORLD_CHUNK_SIZE - 1)
-        start_mod_y = start[1] & (WORLD_CHUNK_SIZE - 1)
-        chunk_num_x = ceil((start_mod_x + self.view_size[0]) / WORLD_CHUNK_SIZE)
-        chunk_num_y = ceil((start_mod_y + self.view_size[1]) / WORLD_CHUNK_SIZE)
-        uncut_view = numpy.empty((chunk_num_x * WORLD_CHUNK_SIZE, chunk_num_y * WORLD_CHUNK_SIZE, 4))
-
-        #print("view_size", self.view_size)
-        #print("start", start)
-        #print("end", end)
-        #print("start_chunk", start_chunk_x, start_chunk_y)
-        #print("start_mod", start_mod_x, start_mod_y)
-        #print("chunk_num", chunk_num_x, chunk_num_y)
-
-        for chunk_delta_x, chunk_delta_y in numpy.ndindex((chunk_num_x, chunk_num_y)):
-            chunk_x = start_chunk_x + chunk_delta_x
-            chunk_y = start_chunk_y + chunk_delta_y
-
-            if not (chunk_x, chunk_y) in self.chunks:
-                self.chunks[(chunk_x, chunk_y)] = numpy.zeros((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE, 4))
-                self.chunks[(chunk_x, chunk_y)][:, :, 0] = self.block_name["dirt_block"]
-
-            uncut_view[chunk_delta_x * WORLD_CHUNK_SIZE:(chunk_delta_x + 1) * WORLD_CHUNK_SIZE, chunk_delta_y * WORLD_CHUNK_SIZE:(chunk_delta_y + 1) * WORLD_CHUNK_SIZE] = self.chunks[(chunk_x, chunk_y)]
-
-        window.world_view = self.view = uncut_view[start_mod_x:start_mod_x + self.view_size[0], start_mod_y:start_mod_y + self.view_size[1]]
-
-            # print("chunk", "[rel]", chunk_delta_x, chunk_delta_y, "[abs]", chunk_x, chunk_y)
-            
-            # copy_start_x = max(start[0], chunk_x * WORLD_CHUNK_SIZE) & (WORLD_CHUNK_SIZE - 1)
-            # copy_start_y = max(start[1], chunk_y * WORLD_CHUNK_SIZE) & (WORLD_CHUNK_SIZE - 1)
-            # copy_end_x = min(end[0], (chunk_x + 1) * WORLD_CHUNK_SIZE - 1) & (WORLD_CHUNK_SIZE - 1)
-            # copy_end_y = min(end[1], (chunk_y + 1) * WORLD_CHUNK_SIZE - 1) & (WORLD_CHUNK_SIZE - 1)
-            # print("copy start", copy_start_x, copy_start_y)
-            # print("copy end", copy_end_x, copy_end_y)
-            # print("copy size", copy_end_x - copy_start_x, copy_end_y - copy_start_y)
-
-            # dest_start_x = max(0, WORLD_CHUNK_SIZE * (chunk_x) - start_mod_x)
-            # dest_start_y = max(0, WORLD_CHUNK_SIZE * (chunk_y) - start_mod_y)
-            # dest_end_x = copy_end_x - copy_start_x + dest_start_x#min(self.view_size[0], start_mod_x + WORLD_CHUNK_SIZE * (chunk_x - 1))
-            # dest_end_y = copy_end_y - copy_start_y + dest_start_y#min(self.view_size[1], start_mod_y + WORLD_CHUNK_SIZE * (chunk_y - 1))
-            # print("dest start", dest_start_x, dest_start_y)
-            # print("dest end", dest_end_x, dest_end_y)
-            # print("dest size", dest_end_x - dest_start_x, dest_end_y - dest_start_y)
-
-            # data = self.chunks[(chunk_x, chunk_y)][copy_start_x:copy_end_x, copy_start_y:copy_end_y]
-            # self.view[dest_start_x:dest_end_x, dest_start_y:dest_end_y] = data
+    @staticmethod
+    def _view_wrap(start: int, end: int, size: int):
+        """
+        Split a range into at most two ranges, which are continuous in the ring buffer view.
+        """
+        split = start + size - start % size
+        if end <= split:
+            return ((start, end),)
+        return ((start, split), (split, end))
+
+    def update_view_block(self, x: int, y: int):
+        """
+        Copy a changed block into the view, if it is visible.
+        """
+        if self.get_generating_in_background(): # The main thread copies the chunk into the view
+            self.generated_changes.append(("chunk", (x >> WORLD_CHUNK_SIZE_POWER, y >> WORLD_CHUNK_SIZE_POWER)))
+            return
+        if not (self.view_start[0] <= x < self.view_start[0] + self.view_size[0] and self.view_start[1] <= y < self.view_start[1] + self.view_size[1]):
+            return
+        buffer_x = x % self.view_size[0]
+        buffer_y = y % self.view_size[1]
+        self.view[buffer_x, buffer_y] = self.chunks[(x >> WORLD_CHUNK_SIZE_POWER, y >> WORLD_CHUNK_SIZE_POWER)][x & (WORLD_CHUNK_SIZE - 1), y & (WORLD_CHUNK_SIZE - 1)]
+        self.view_dirty.add((buffer_x, buffer_y))
 
     def save(self, window):
         window.loading_progress[:3] = "Saving inventory", 0, 2
@@ -355,17 +861,243 @@ class World:
         self.item_count = int(os.environ.get("item_count"))
         self.player.inventory.save(self)
         window.loading_progress[:2] = "Saving world", 1
-        file.save("data/user/world.data", self, file_format="pickle")
+        self.save_file("data/user/world.data")
         window.loading_progress[1] = 2
         time.sleep(0.1)
 
+    def save_file(self, path: str):
+        """
+        Write the world into a chunked world file.
+        Chunks which are not in memory are copied without decoding.
+        """
+        with self.generation_lock: # Generation changes chunks and entities
+            self.apply_generated_changes()
+            chunks = self.get_file_chunks()
+
+            with self.world_file_lock:
+                self.save_id = self.create_save_id()
+                self.dirty_chunks.clear()
+                self.journaled_chunks.clear()
+                sections = self.get_file_sections()
+
+                self.close_file()
+                world_file.save(path, sections, chunks)
+                self.world_file = world_file.WorldFile(path)
+                self.world_file_remap = None
+
+    def get_file_chunks(self, coords=None):
+        """
+        Returns copies of chunks {(chunk_x, chunk_y): chunk array or encoded chunk} for writing a world file, all chunks if coords is None.
+        Chunks which are not in memory are not decoded, unless the block indices of the world file changed.
+        """
+        if coords is None:
+            coords = {*self.chunks, *self.scratch_file.chunks, *self.filled_chunks, *(() if self.world_file is None else self.world_file.chunks)}
+
+        chunks = {}
+        for coord in coords:
+            if coord in self.chunks:
+                chunks[coord] = self.chunks[coord].copy()
+            elif coord in self.scratch_file.chunks:
+                chunks[coord] = self.scratch_file.read_chunk_data(coord)
+            elif coord in self.filled_chunks:
+                chunks[coord] = self.get_filled_chunk()
+            elif self.world_file_remap is None:
+                chunks[coord] = self.world_file.read_chunk_data(coord)
+            else:
+                chunks[coord] = self.read_world_file_chunk(coord)
+        return chunks
+
+    def get_file_sections(self):
+        """
+        Returns the sections of the world file, except for the chunks.
+        """
+        # The inventory is stored in its own section
+        inventory = self.player.inventory
+        self.player.inventory = None
+        try:
+            entities = pickle.dumps({"player": self.player, "entities": self.entities})
+        finally:
+            self.player.inventory = inventory
+
+        return {
+            "info": json.dumps({
+                "seed": self.seed, "camera_stop": self.camera_stop, "enemy_stop": self.enemy_stop, "item_count": self.item_count, "save_id": self.save_id, "spare": self.spare,
+                "chunk_stages": [[chunk_x, chunk_y, stage] for (chunk_x, chunk_y), stage in self.chunk_stages.items()],
+                "cave_stream": self.cave_stream
+            }).encode(),
+            "blocks": json.dumps(self.block_index).encode(),
+            "entities": entities,
+            "spawns": numpy.array(
+                [(chunk_x, chunk_y, *spawn) for (chunk_x, chunk_y), spawns in self.spawn_records.items() for spawn in spawns.tolist()],
+                dtype=WORLD_SPAWN_DTYPE
+            ).tobytes(),
+            "inventory": pickle.dumps(inventory)
+        }
+
+    @staticmethod
+    def create_save_id():
+        return int.from_bytes(os.urandom(8), "little") >> 1
+
+    def autosave(self, window, delta_time: float):
+        """
+        Periodically write changed chunks and entities into the world file journal on a background thread.
+        A world without world file is saved completely instead.
+        """
+        if not window.options["save world"]:
+            return
+
+        if self.autosave_data is None:
+            self.autosave_timer += delta_time
+            if self.autosave_timer < WORLD_AUTOSAVE_INTERVAL or not self.generation_lock.acquire(blocking=False): # Retried after the generation
+                return
+            self.autosave_timer = 0.0
+
+            # Copy the data, as the world changes while the thread is writing
+            try:
+                self.apply_generated_changes()
+                self.item_count = int(os.environ.get("item_count"))
+                self.player.inventory.selected = self.player.holding
+                if self.world_file is None or world_file.get_journal_size(self.world_file.path) > WORLD_JOURNAL_LIMIT:
+                    chunks = self.get_file_chunks()
+                    # Chunks of the world file are moved to the scratch file, as the world file is replaced
+                    if not self.world_file is None:
+                        for coord, chunk in chunks.items():
+                            if not (coord in self.chunks or coord in self.scratch_file.chunks or coord in self.filled_chunks):
+                                self.scratch_file.write_chunk(coord, chunk)
+                        self.close_file()
+                        self.world_file_remap = None
+                    self.save_id = self.create_save_id()
+                    self.journaled_chunks.clear()
+                else:
+                    chunks = self.get_file_chunks(self.dirty_chunks)
+                    self.journaled_chunks.update(self.dirty_chunks)
+                self.dirty_chunks.clear()
+                self.autosave_data = ("data/user/world.data", self.world_file is None, self.save_id, self.get_file_sections(), chunks)
+            finally:
+                self.generation_lock.release()
+
+        created, finished = threaded(self.write_autosave, *self.autosave_data)
+        if finished:
+            self.autosave_data = None
+            if created and self.world_file is None:
+                self.world_file = world_file.WorldFile("data/user/world.data")
+                # Chunks which are stored unchanged in the new world file are not needed in the scratch file
+                for coord in tuple(self.scratch_file.chunks):
+                    if coord in self.world_file.chunks and not (coord in self.dirty_chunks or coord in self.journaled_chunks):
+                        self.scratch_file.remove_chunk(coord)
+
+    def write_autosave(self, path: str, complete: bool, save_id: int, sections: dict, chunks: dict):
+        """
+        Returns whether the world file was created.
+        """
+        with self.world_file_lock:
+            if save_id != self.save_id: # World file was saved in the meantime
+                return False
+            if complete:
+                world_file.save(path, sections, chunks)
+                return True
+            del sections["blocks"]
+            world_file.append_journal(path, save_id, sections, chunks)
+            return False
+
+    def close_file(self):
+        """
+        Close the world file. Chunks which were not decoded yet are lost.
+        """
+        with self.world_file_lock:
+            if not self.world_file is None:
+                self.world_file.close()
+                self.world_file = None
+
+    @staticmethod
+    def load_file(block_data, path: str):
+        """
+        Open a world file. Chunks are decoded when they are first accessed.
+        Returns None if the file does not exist.
+        """
+        if not file.exists(path):
+            return None
+        world = World(*block_data)
+
+        if not world_file.is_world_file(path):
+            # Convert pickled world files of older versions
+            old_world = file.load(path, default=0, file_format="pickle")
+            if not isinstance(old_world, World):
+                return None
+            world.seed, world.camera_stop, world.item_count = old_world.seed, old_world.camera_stop, old_world.item_count
+            world.remove_entity(world.player)
+            world.player = old_world.player
+            for entity in old_world.entities:
+                world.add_entity(entity)
+            for coord, chunk in old_world.chunks.items():
+                world.chunks[coord] = chunk.astype(WORLD_CHUNK_DTYPE)
+                world.find_torches(*coord)
+            return world
+
+        world.world_file = world_file.WorldFile(path)
+        sections = {name: world.world_file.read_section(name) for name in ("info", "blocks", "entities", "inventory", "spawns") if name in world.world_file.sections}
+        world.save_id = json.loads(sections["info"]).get("save_id", 0)
+        world.world_file_remap = world.get_block_remap(sections["blocks"])
+
+        # Apply changes of the journal, whose chunks might use other block indices than the world file
+        journal_sections, journal_chunks = world_file.read_journal(path, world.save_id)
+        sections.update(journal_sections)
+        remaps = {None: world.world_file_remap}
+        for coord, (data, blocks) in journal_chunks.items():
+            if not blocks in remaps:
+                remaps[blocks] = world.get_block_remap(blocks)
+            chunk = world_file.decode_chunk(data)
+            if not remaps[blocks] is None:
+                chunk[:, :, :3] = remaps[blocks][chunk[:, :, :3]]
+            world.chunks[coord] = chunk
+            world.find_torches(*coord)
+        world.journaled_chunks.update(journal_chunks)
+
+        info = json.loads(sections["info"])
+        world.seed, world.camera_stop, world.item_count = info["seed"], info["camera_stop"], info["item_count"]
+        world.enemy_stop = info.get("enemy_stop", 0)
+        world.chunk_stages = {(chunk_x, chunk_y): stage for chunk_x, chunk_y, stage in info.get("chunk_stages", [])}
+        world.cave_stream = info.get("cave_stream")
+
+        entities = pickle.loads(sections["entities"])
+        if info.get("spare", False): # The player of a spare world is replaced by the new player
+            for entity in entities["entities"] - {entities["player"]}:
+                world.add_entity(entity)
+        else:
+            world.remove_entity(world.player)
+            world.player = entities["player"]
+            for entity in entities["entities"]:
+                world.add_entity(entity)
+            world.player.inventory = pickle.loads(sections["inventory"])
+            world.player.holding = world.player.inventory.selected
+
+        if "spawns" in sections:
+            for chunk_x, chunk_y, *spawn in numpy.frombuffer(sections["spawns"], dtype=WORLD_SPAWN_DTYPE).reshape(-1, 6).tolist():
+                world.spawn_records.setdefault((int(chunk_x), int(chunk_y)), []).append(spawn)
+            world.spawn_records = {coord: numpy.array(spawns, dtype=WORLD_SPAWN_DTYPE) for coord, spawns in world.spawn_records.items()}
+
+        return world
+
+    def get_block_remap(self, blocks: bytes):
+        """
+        Map block indices of a saved blocks section by name, in case blocks were added or removed.
+        Returns an array of saved block indices -> current block indices, None if they are equal.
+        """
+        block_index = {int(index): name for index, name in json.loads(blocks).items()}
+        remap = numpy.zeros(max(block_index) + 1, dtype=WORLD_CHUNK_DTYPE)
+        for index, name in block_index.items():
+            remap[index] = self.block_name.get(name, 0)
+        if any(remap[index] != index for index in block_index):
+            return remap
+        return None
+
     @staticmethod
     def load(window, block_data):
         window.loading_progress[:3] = "Loading world file", 1, 2
-        world = file.load("data/user/world.data", default=0, file_format="pickle")
 
         try:
-            if isinstance(world, World):
+            world = World.load_file(block_data, "data/user/world.data")
+            if not world is None:
                 window.loading_progress[:3] = "Loading world", 2, 2
                 os.environ["item_count"] = str(world.item_count)
                 return world
@@ -373,9 +1105,72 @@ class World:
             print(e)
             pass
 
-        world = World(*block_data)
-        generated = False
-        while not generated:
-            generated = generate_world(world, window)
+        # Use a spare world of the world pool
+        global pool_full
+        pool_full = False
+        try:
+            if world_file.take_pool_world("data/user/world.data"):
+                world = World.load_file(block_data, "data/user/world.data")
+                if not world is None:
+                    window.loading_progress[:3] = "Loading world", 2, 2
+                    # Items of the new player are counted from 0, items of the spare world up to its item count
+                    world.item_count = max(world.item_count, int(os.environ.get("item_count", "0")))
+                    os.environ["item_count"] = str(world.item_count)
+                    return world
+        except Exception as e:
+            print(e)
+            pass
 
+        world = World(*block_data)
+        generate_world(world, window)
         return world
+
+
+# Spare worlds are generated in a background process while the game is played
+pool_process: multiprocessing.Process = None # Process which generates a spare world
+pool_full: bool = False
+
+
+def update_pool(block_data):
+    """
+    Generate a spare world in a background process, if the world pool is not full.
+    A process does not compete with the game loop for the GIL and has its own item counter.
+    Called every frame while the game is played.
+    """
+    global pool_process, pool_full
+    if pool_full:
+        return
+
+    if not pool_process is None:
+        if pool_process.is_alive():
+            return
+        pool_process.join()
+        if pool_process.exitcode: # Not retried every frame
+            pool_full = True
+        pool_process = None
+        return
+
+    if len(world_file.get_pool_paths()) >= WORLD_POOL_SIZE or world_file.get_pool_size() >= WORLD_POOL_DISK_LIMIT:
+        pool_full = True
+        return
+    # Spawned processes start without the window and threads of the game (main.py is guarded by __main__)
+    pool_process = multiprocessing.get_context("spawn").Process(target=generate_pool_world, args=(block_data,), daemon=True)
+    pool_process.start()
+
+
+def generate_pool_world(block_data):
+    """
+    Generate a world and save it into the world pool. Runs in the pool process with a lower priority.
+    Only the intro area is generated completely, like when a new game is started.
+    """
+    if hasattr(os, "nice"): # Not available on Windows
+        os.nice(WORLD_POOL_NICENESS)
+
+    class LoadingWindow:
+        loading_progress = ["", 0, 0]
+
+    world = World(*block_data)
+    generate_world(world, LoadingWindow())
+    world.spare = True
+    world.save_file(f"{WORLD_POOL_PATH}/world{time.time_ns()}.data")
+    world.close_file()
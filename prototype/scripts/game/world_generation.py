@@ -1,205 +1,305 @@
 # -*- coding: utf-8 -*-
-from scripts.utility.noise_functions import snoise2
+from scripts.utility.noise_functions import snoise2_array
 from scripts.utility.const import *
 from scripts.game import structure
 from scripts.game.entity import *
 from scripts.game import cave
-import copy
+import itertools
+import hashlib
 
 
 # Called from World
-def generate_world(world, window):
+def generate_world(world, window, seed: int=None):
     """
     Main world generation function
+    Only the intro is carved at once. Caves are extended segment by segment when they are reached (extend_caves),
+    the remaining stages of chunks are generated afterwards (generate_chunks).
+    The same seed always generates the same blocks.
     """
-    world.seed: float = random.randint(-10**6, 10**6) + e # Float between -10^6 and 10^6
-    window.loading_progress[2] = 11
+    if seed is None:
+        seed = random.randint(-10**6, 10**6)
+    rng = random.Random(seed) # Generation must not use the global random module
+    world.seed: float = seed + e # Float between -10^6 and 10^6
+    window.loading_progress[2] = 5
 
     # Load structures
     window.loading_progress[:2] = "Loading structures", 0
-    structures = structure.load(world.block_name)
-    goal_structure = structures["goal"]
-    del structures["goal"]
+    world.structures = structure.load(world.block_name)
+    structure_names = sorted(name for name in world.structures if name != "goal")
 
     # Starting point
     position = [0, 0]
-    poles = set() # List of x coords of poles
 
     # Generate intro
     window.loading_progress[:2] = "Generating intro", 1
     cave.intro(world, window, position)
-    cave.horizontal(world, position)
+    cave.horizontal(world, rng, position)
+
+    # Cave segments are generated ahead of the player, the state is saved with the world
+    start_chunk_x = min(chunk_x for chunk_x, chunk_y in tuple(world.chunks))
+    world.camera_stop = world.enemy_stop = inf # Until the goal is generated
+    world.cave_stream = {
+        "position": position,
+        "segment": 0, # Number of generated segments
+        "next_special": 5,
+        "structure_names": rng.sample(structure_names, k=len(structure_names)),
+        "structure_index": 0,
+        "structures": [], # [x, y, name] of structures, which are placed when the caves around them are finished
+        "poles": [], # [x, start_y, end_y] of vertical caves, which need a pole
+        "flattened_chunk_x": [start_chunk_x, start_chunk_x], # Chunk columns left of these are flattened once and twice
+        "released_chunk_x": start_chunk_x # Chunk columns left of this are passed to generate_chunks
+    }
+
+    # Terrain, foliage and enemies are generated when chunks are reached
+    window.loading_progress[:2] = "Generating caves", 4
+    world.generate(WORLD_GENERATION_DISTANCE)
 
-    # Generate cave segments
-    window.loading_progress[:2] = "Generating caves", 5
 
-    segments_count = 50
+# Called from World
+def extend_caves(world, end_chunk_x: int):
+    """
+    Generate cave segments until all chunk columns left of end_chunk_x are finished and passed to generate_chunks.
+    The segments are generated one at a time, so the caves do not depend on how far they were extended before.
+    world.cave_stream is None after the goal was generated.
+    """
+    if world.cave_stream is None or world.cave_stream["released_chunk_x"] >= end_chunk_x:
+        return
+    if world.structures is None: # Structures are loaded once per world
+        world.structures = structure.load(world.block_name)
+
+    while not world.cave_stream is None and world.cave_stream["released_chunk_x"] < end_chunk_x:
+        finished = generate_segment(world, world.cave_stream, world.structures)
+        settle_caves(world, world.cave_stream, world.structures, finished)
+        if finished:
+            world.cave_stream = None
+
+
+# Called from extend_caves
+def generate_segment(world, stream: dict, structures: dict):
+    """
+    Carve the next cave segment. Returns whether it was the goal.
+    """
+    position = stream["position"]
+    rng = random.Random(f"{world.seed} segment {stream['segment']}")
+    stream["segment"] += 1
+
     min_special_distance = 2
     special_speading = 2
-    next_special = 5
 
-    structure_names = random.sample(list(structures.keys()), k=len(structures))
-    structure_index = 0
-    generated_structures = []
+    if WORLD_GENERATION_SEGMENTS and stream["segment"] > WORLD_GENERATION_SEGMENTS:
+        # Goal
+        structure_data = structures["goal"]
+        cave.interpolated(world, position, end_angle=structure_data["generation"]["entrance_angle"], end_radius=structure_data["generation"]["entrance_size"] / 2)
+        world.enemy_stop = position[0] # maximum x of enemies
+        world.camera_stop = position[0] + 40
+        stream["structures"].append([
+            round(position[0] - structure_data["generation"]["entrance_coord"][0]),
+            round(position[1] - structure_data["generation"]["entrance_coord"][1]),
+            "goal"
+        ])
+        return True
+
+    stream["next_special"] -= 1
+
+    if stream["next_special"]:
+        # Horizontal cave
+        cave.horizontal(world, rng, position)
+    else:
+        # Special cave (vertical, blob or random structure)
+        stream["next_special"] = min_special_distance + rng.randint(0, special_speading)
+        cave_type = rng.random()
 
-    for _ in range(segments_count):
-        next_special -= 1
+        if cave_type < 0.6:
+            # Structure
+            structure_name = stream["structure_names"][stream["structure_index"]]
+            structure_data = structures[structure_name]
 
-        if next_special:
-            # Horizontal cave
-            cave.horizontal(world, position)
-        else:
-            # Special cave (vertical, blob or random structure)
-            next_special = min_special_distance + random.randint(0, special_speading)
-            cave_type = random.random()
+            stream["structure_index"] += 1
+            if stream["structure_index"] == len(stream["structure_names"]):
+                stream["structure_names"] = rng.sample(sorted(stream["structure_names"]), k=len(stream["structure_names"]))
+                stream["structure_index"] = 0
 
-            if cave_type < 0.6:
-                # Structure
-                structure_name = structure_names[structure_index]
-                structure_data = structures[structure_name]
+            cave.interpolated(world, position, end_angle=structure_data["generation"]["entrance_angle"], end_radius=structure_data["generation"]["entrance_size"] / 2)
 
-                structure_index += 1
-                if structure_index == len(structures):
-                    structure_names = random.sample(list(structures.keys()), k=len(structures))
-                    structure_index = 0
+            x = round(position[0] - structure_data["generation"]["entrance_coord"][0])
+            y = round(position[1] - structure_data["generation"]["entrance_coord"][1])
+            stream["structures"].append([x, y, structure_name])
 
-                cave.interpolated(world, position, end_angle=structure_data["generation"]["entrance_angle"], end_radius=structure_data["generation"]["entrance_size"] / 2)
+            world.blit(x, y, numpy.full(structure_data["array"].shape[:2], world.block_name["dirt_block"]), 0)
 
-                generated_structure = (
-                    round(position[0] - structure_data["generation"]["entrance_coord"][0]),
-                    round(position[1] - structure_data["generation"]["entrance_coord"][1]),
-                    structure_data["array"]
-                )
+            position[0] += structure_data["generation"]["exit_coord"][0] - structure_data["generation"]["entrance_coord"][0]
+            position[1] += structure_data["generation"]["exit_coord"][1] - structure_data["generation"]["entrance_coord"][1]
 
-                generated_structures.append(generated_structure)
+            cave.interpolated(world, position, start_angle=structure_data["generation"]["exit_angle"], start_radius=structure_data["generation"]["exit_size"] / 2)
 
-                for dx, dy in numpy.ndindex(generated_structure[2].shape[:2]):
-                    world.set_block(generated_structure[0] + dx, generated_structure[1] + dy, world.block_name["dirt_block"])
+        elif cave_type < 0.9:
+            # Vertical (no branch)
+            start_y = position[1]
+            cave.vertical(world, rng, position)
+            if not any(pole[0] == int(position[0]) for pole in stream["poles"]):
+                stream["poles"].append([int(position[0]), int(start_y), int(position[1])])
 
-                position[0] += structure_data["generation"]["exit_coord"][0] - structure_data["generation"]["entrance_coord"][0]
-                position[1] += structure_data["generation"]["exit_coord"][1] - structure_data["generation"]["entrance_coord"][1]
+        else:
+            # Blob
+            cave.blob(world, position)
 
-                cave.interpolated(world, position, start_angle=structure_data["generation"]["exit_angle"], start_radius=structure_data["generation"]["exit_size"] / 2)
+    return False
 
-            elif cave_type < 0.9:
-                # Vertical (no branch)
-                cave.vertical(world, position)
-                poles.add(int(position[0]))
 
+# Called from extend_caves
+def settle_caves(world, stream: dict, structures: dict, finished: bool):
+    """
+    Finish the chunk columns, which the next cave segments can not reach anymore:
+    Flatten their cave walls, place structures and poles and pass them to generate_chunks.
+    """
+    if finished: # All chunk columns including the goal
+        end_x = max([int(stream["position"][0])] + [x + structures[structure_name]["array"].shape[0] for x, y, structure_name in stream["structures"]])
+        carved_chunk_x = ((end_x + WORLD_GENERATION_CARVE_MARGIN) >> WORLD_CHUNK_SIZE_POWER) + 3
+    else:
+        carved_chunk_x = (int(stream["position"][0]) - WORLD_GENERATION_CARVE_MARGIN) >> WORLD_CHUNK_SIZE_POWER
+
+    # Smoother cave walls, each pass needs the previous pass of the next column
+    for index in range(2):
+        end_chunk_x = carved_chunk_x - 1 - index
+        if stream["flattened_chunk_x"][index] < end_chunk_x:
+            flatten_edges(world, world.get_chunk_coords(stream["flattened_chunk_x"][index], end_chunk_x))
+            stream["flattened_chunk_x"][index] = end_chunk_x
+    flattened_chunk_x = stream["flattened_chunk_x"][1]
+
+    # Place structures between line cave segments
+    for x, y, structure_name in stream["structures"].copy():
+        array = structures[structure_name]["array"]
+        if ((x + array.shape[0] - 1) >> WORLD_CHUNK_SIZE_POWER) + 2 > flattened_chunk_x:
+            continue
+        stream["structures"].remove([x, y, structure_name])
+        world.blit(x, y, array)
+
+        # Crates are entities
+        for dx, dy in numpy.argwhere(array[:, :, 0] == world.block_name["crate"]).tolist():
+            world.set_block(x + dx, y + dy, 0)
+            world.add_entity(Crate((x + dx, y + dy)))
+
+    # Place poles after the structures around them
+    structures_chunk_x = min([x >> WORLD_CHUNK_SIZE_POWER for x, y, structure_name in stream["structures"]], default=flattened_chunk_x)
+    for x, start_y, end_y in stream["poles"].copy():
+        pole_end_chunk_x = ((x + WORLD_GENERATION_POLE_SEARCH_RADIUS) >> WORLD_CHUNK_SIZE_POWER) + 1
+        if pole_end_chunk_x + 1 > flattened_chunk_x or pole_end_chunk_x > structures_chunk_x:
+            continue
+        stream["poles"].remove([x, start_y, end_y])
+        generate_pole(world, random.Random(f"{world.seed} pole {x}"), x, start_y, end_y)
+
+    # Chunk columns without pending structures and poles are finished
+    # The last flattened column is read when the next columns are flattened, so it must not be filled with terrain yet
+    released_chunk_x = min([
+        flattened_chunk_x - 1, structures_chunk_x,
+        *[(x - WORLD_GENERATION_POLE_SEARCH_RADIUS) >> WORLD_CHUNK_SIZE_POWER for x, start_y, end_y in stream["poles"]]
+    ])
+    if stream["released_chunk_x"] < released_chunk_x:
+        for coord in world.get_chunk_coords(stream["released_chunk_x"], released_chunk_x):
+            world.chunk_stages[coord] = WORLD_STAGE_CARVED
+        stream["released_chunk_x"] = released_chunk_x
+
+
+# Called from World
+def generate_chunks(world, end_chunk_x: int):
+    """
+    Run the pending generation stages of all chunks left of end_chunk_x.
+    Chunks are generated column by column, so the result does not depend on how far the world was generated before.
+    Each stage of a column needs the previous stage of the next column.
+    """
+    for stage in (WORLD_STAGE_TERRAIN, WORLD_STAGE_DECORATED, WORLD_STAGE_POPULATED):
+        stage_end_chunk_x = end_chunk_x + WORLD_STAGE_POPULATED - stage
+        coords = sorted(coord for coord, chunk_stage in world.chunk_stages.items() if chunk_stage < stage and coord[0] < stage_end_chunk_x)
+
+        # Chunks might only be stored in the world file
+        for chunk_x, chunk_y in coords:
+            for coord in ((chunk_x, chunk_y), (chunk_x, chunk_y + 1)):
+                if not coord in world.chunks:
+                    world.load_chunk(*coord)
+        coords = [coord for coord in coords if coord in world.chunks]
+
+        if stage == WORLD_STAGE_TERRAIN:
+            generate_terrain(world, coords)
+        for chunk_x, chunk_y in coords:
+            rng = random.Random(f"{world.seed} {chunk_x} {chunk_y} {stage}")
+            area = (chunk_x * WORLD_CHUNK_SIZE, chunk_y * WORLD_CHUNK_SIZE, (chunk_x + 1) * WORLD_CHUNK_SIZE, (chunk_y + 1) * WORLD_CHUNK_SIZE)
+            if stage == WORLD_STAGE_DECORATED:
+                generate_foliage(world, rng, *find_edge_blocks(world, *area))
+            elif stage == WORLD_STAGE_POPULATED:
+                spawn_enemies(world, rng, find_edge_blocks(world, *area)[0])
+
+            if stage == WORLD_STAGE_POPULATED:
+                del world.chunk_stages[(chunk_x, chunk_y)]
             else:
-                # Blob
-                cave.blob(world, position)
-
-    structure_data = goal_structure
-    cave.interpolated(world, position, end_angle=structure_data["generation"]["entrance_angle"], end_radius=structure_data["generation"]["entrance_size"] / 2)
-    last_enemy_x = position[0]
-    world.camera_stop = position[0] + 40
-    generated_structures.append((
-        round(position[0] - structure_data["generation"]["entrance_coord"][0]),
-        round(position[1] - structure_data["generation"]["entrance_coord"][1]),
-        structure_data["array"]
-    ))
-
-    # Smoother cave walls
-    flatten_edges(world)
-    flatten_edges(world)
-
-    # Generate structures between line cave segments
-    window.loading_progress[:2] = "Generating structures", 7
-    for x, y, array in generated_structures:
-        for dx, dy in numpy.ndindex(array.shape[:2]):
-            world.set_block(x + dx, y + dy, array[dx, dy], layer=slice(None))
-
-    # Generate foliage
-    window.loading_progress[:2] = "Generating foliage", 9
-
-    # Find block edges with air
-    blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left = find_edge_blocks(world)
-
-    # Generate poles
-    poles_successful = generate_poles(world, poles, blocks_ground, blocks_ceiling)
-    if not poles_successful:
-        return 0
-
-    # Generate foliage
-    generate_foliage(world, blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left)
-
-    # Spawn enemies
-    window.loading_progress[:2] = "Spawing enemies", 11
-    spawn_blocks = sorted(random.sample(list(blocks_ground), k=int(0.1 * len(blocks_ground))))
+                world.chunk_stages[(chunk_x, chunk_y)] = stage
+
+
+# Called from generate_chunks
+def spawn_enemies(world, rng, blocks_ground):
+    """
+    Choose the enemies of the ground blocks of a chunk. They are stored as spawn records and created when they are reached.
+    """
+    spawn_blocks = blocks_ground[sorted(rng.sample(range(len(blocks_ground)), k=int(0.1 * len(blocks_ground))))]
     last_bat = 0
+    spawns = []
 
-    for coord in spawn_blocks:
-        if coord[0] < 30 or coord[1] > -500 or world.get_block(coord[0], coord[1] + 1) or coord[0] > last_enemy_x or world.get_water(coord[0], coord[1]):
+    for coord in map(tuple, spawn_blocks.tolist()):
+        if coord[0] < 30 or coord[1] > -500 or world.get_block(coord[0], coord[1] + 1) or coord[0] > world.enemy_stop or world.get_water(coord[0], coord[1]):
             continue
         if coord[0] < 100:
-            if random.randint(0, 1):
+            if rng.randint(0, 1):
                 continue
             Entity = GreenSlime
         elif coord[0] < 300:
-            Entity = random.choice((GreenSlime, Bat))
+            Entity = rng.choice((GreenSlime, Bat))
         elif coord[0] < 400:
-            Entity = random.choice((GreenSlime, Bat, Goblin))
+            Entity = rng.choice((GreenSlime, Bat, Goblin))
         elif coord[0] < 600:
-            Entity = random.choice((GreenSlime, YellowSlime, Bat, Goblin))
+            Entity = rng.choice((GreenSlime, YellowSlime, Bat, Goblin))
         else:
-            Entity = random.choice((GreenSlime, YellowSlime, BlueSlime, Bat, Goblin))
+            Entity = rng.choice((GreenSlime, YellowSlime, BlueSlime, Bat, Goblin))
         if Entity == Bat:
             if coord[0] < last_bat + 10:
                 continue
             last_bat = coord[0]
-        world.add_entity(Entity(coord))
-
-    return 1
-
+        spawns.append((*coord, ENEMY_KINDS.index(Entity), -1)) # Enemies choose their weapon when they are created
 
-# Called from generate_world
-def find_edge_blocks(world):
-    blocks_ground = set()
-    blocks_ceiling = set()
-    blocks_wall_right = set()
-    blocks_wall_left = set()
+    world.add_spawns(numpy.array(spawns, dtype=WORLD_SPAWN_DTYPE).reshape(-1, 4))
 
-    for coord in world.iterate():
-        block_type = world.get_block(*coord, layer=0)
-
-        if block_type == world.block_name["dirt_block"]: # Generate terrain block
-            generate_block(world, *coord)
-            continue
-        elif block_type == world.block_name["crate"]:
-            world.set_block(*coord, 0)
-            world.add_entity(Crate(coord))
-        elif block_type != 0: # Not air
-            continue
 
-        x, y = coord
+# Called from generate_chunks
+def find_edge_blocks(world, start_x, start_y, end_x, end_y):
+    """
+    Returns the sorted coordinates (n x 2) of air blocks of an area on ground, on ceiling, on wall right and on wall left.
+    Each air block belongs to the first matching edge.
+    """
+    blocks = world.read_region(start_x - 1, start_y - 1, end_x + 1, end_y + 1, 0) > 0 # Not air
+    air = ~blocks[1:-1, 1:-1]
 
-        if world.get_block(x, y - 1) > 0: # On ground
-            blocks_ground.add(coord)
-        elif world.get_block(x, y + 1) > 0: # On ceiling
-            blocks_ceiling.add(coord)
-        elif world.get_block(x + 1, y) > 0: # On wall right
-            blocks_wall_right.add(coord)
-        elif world.get_block(x - 1, y) > 0: # On wall left
-            blocks_wall_left.add(coord)
+    ground = air & blocks[1:-1, :-2]
+    ceiling = air & ~ground & blocks[1:-1, 2:]
+    wall_right = air & ~ground & ~ceiling & blocks[2:, 1:-1]
+    wall_left = air & ~ground & ~ceiling & ~wall_right & blocks[:-2, 1:-1]
 
-    return blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left
+    return tuple(numpy.argwhere(edge) + (start_x, start_y) for edge in (ground, ceiling, wall_right, wall_left))
 
 
-# Called from generate_world
-def generate_foliage(world, blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left):
-    blocks_ground = random.sample(list(blocks_ground), k=int(WORLD_VEGETATION_FLOOR_DENSITY * len(blocks_ground)))
-    blocks_ceiling = random.choices(list(blocks_ceiling), k=int(WORLD_VEGETATION_CEILING_DENSITY * len(blocks_ceiling)))
-    blocks_wall_right = random.choices(list(blocks_wall_right), k=int(WORLD_VEGETATION_WALL_DENSITY * len(blocks_wall_right)))
-    blocks_wall_left = random.choices(list(blocks_wall_left), k=int(WORLD_VEGETATION_WALL_DENSITY * len(blocks_wall_left)))
+# Called from generate_chunks
+def generate_foliage(world, rng, blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left):
+    # Select indices of the edge blocks
+    blocks_ground = blocks_ground[rng.sample(range(len(blocks_ground)), k=int(WORLD_VEGETATION_FLOOR_DENSITY * len(blocks_ground)))]
+    blocks_ceiling = blocks_ceiling[rng.choices(range(len(blocks_ceiling)), k=int(WORLD_VEGETATION_CEILING_DENSITY * len(blocks_ceiling)))]
+    blocks_wall_right = blocks_wall_right[rng.choices(range(len(blocks_wall_right)), k=int(WORLD_VEGETATION_WALL_DENSITY * len(blocks_wall_right)))]
+    blocks_wall_left = blocks_wall_left[rng.choices(range(len(blocks_wall_left)), k=int(WORLD_VEGETATION_WALL_DENSITY * len(blocks_wall_left)))]
 
-    for (x, y) in blocks_ground + blocks_ceiling + blocks_wall_right + blocks_wall_left:
-        args = get_decoration_block_type(world, x, y)
+    for (x, y) in numpy.concatenate((blocks_ground, blocks_ceiling, blocks_wall_right, blocks_wall_left)).tolist():
+        args = get_decoration_block_type(world, rng, x, y)
         if not args[0] is None:
-            generate_decoration_block(world, x, y, *args)
+            generate_decoration_block(world, rng, x, y, *args)
 
 
-def get_decoration_block_type(world, x, y):
+# Called from generate_foliage
+def get_decoration_block_type(world, rng, x, y):
     block_below = world.get_block(x, y - 1)
     block_above = world.get_block(x, y + 1)
     block_left = world.get_block(x - 1, y)
@@ -207,36 +307,36 @@ def get_decoration_block_type(world, x, y):
     water_level = world.get_water(x, y)
 
     # Exit early
-    if (block_below and block_above) or (0 < water_level < 700) or (block_below != world.block_name["grass_block"] and random.random() > 0.4):
+    if (block_below and block_above) or (0 < water_level < 700) or (block_below != world.block_name["grass_block"] and rng.random() > 0.4):
         return [None]
     if block_left and block_right and block_below:
-        water = random.random()
+        water = rng.random()
         if water > 0.9:
             world.set_water(x, y, (water - 0.7) * 2000)
         return [None]
 
     corner = False
-    flipped = random.randint(0, 1)
+    flipped = rng.randint(0, 1)
 
     # Define requirements
     if block_below:
         side = "above"
         block_name = world.block_index[block_below]
         if block_left:
-            corner = random.randint(0, 1)
+            corner = rng.randint(0, 1)
             flipped = 1
         elif block_right:
-            corner = random.randint(0, 1)
+            corner = rng.randint(0, 1)
             flipped = 0
 
     elif block_above:
         side = "below"
         block_name = world.block_index[block_above]
         if block_left:
-            corner = random.randint(0, 1)
+            corner = rng.randint(0, 1)
             flipped = 1
         elif block_right:
-            corner = random.randint(0, 1)
+            corner = rng.randint(0, 1)
             flipped = 0
 
     elif block_left:
@@ -252,31 +352,62 @@ def get_decoration_block_type(world, x, y):
     else:
         return [None]
 
-    block_comparison = ("any", block_name, world.block_family[block_name])
+    key = (side, block_name, bool(water_level), corner)
+    if not len(get_decoration_candidates(world, *key)[0]):
+        return [None]
 
-    decoration_list = list(filter(lambda name: (
-        any([selected in block_comparison for selected in world.block_generation_properties[name].get("on", "any").split("|")]) and
-        side == world.block_generation_properties[name].get("side", "above") and
-        (bool(water_level) == world.block_generation_properties[name].get("water", False) or
-        "any" == world.block_generation_properties[name].get("water", False)) and
-        corner == world.block_generation_properties[name].get("corner", False)
-    ), list(world.block_generation_properties)))
+    decoration_block = choose_decoration_blocks(world, [key], [rng.random()])[0]
+    return decoration_block, flipped, side
 
-    if not len(decoration_list):
-        return [None]
 
-    decoration_block = random.choices(decoration_list, weights=[world.block_generation_properties[name].get("weight", 1) for name in decoration_list])
+def get_decoration_candidates(world, side, block_name, water, corner):
+    """
+    Returns the decoration blocks, which can be generated next to a block, and their cumulative weights.
+    The candidates of each combination are only searched once and stored in world.decoration_index.
+    """
+    key = (side, block_name, water, corner)
+    if not key in world.decoration_index:
+        block_comparison = ("any", block_name, world.block_family[block_name])
 
-    if len(decoration_block):
-        decoration_block = decoration_block[0]
-    else:
-        decoration_block = None
+        decoration_list = list(filter(lambda name: (
+            any([selected in block_comparison for selected in world.block_generation_properties[name].get("on", "any").split("|")]) and
+            side == world.block_generation_properties[name].get("side", "above") and
+            (water == world.block_generation_properties[name].get("water", False) or
+            "any" == world.block_generation_properties[name].get("water", False)) and
+            corner == world.block_generation_properties[name].get("corner", False)
+        ), sorted(world.block_generation_properties)))
 
-    return decoration_block, flipped, side
+        cum_weights = numpy.array(list(itertools.accumulate(world.block_generation_properties[name].get("weight", 1) for name in decoration_list)))
+        world.decoration_index[key] = (decoration_list, cum_weights)
+
+    return world.decoration_index[key]
+
+
+def choose_decoration_blocks(world, keys, values):
+    """
+    Returns a decoration block (or None) for each key (side, block_name, water, corner) at once.
+    values: random numbers (0 <= value < 1), which select the decoration blocks like random.choices with their weights
+    """
+    values = numpy.asarray(values, dtype=float)
+    decoration_blocks = [None] * len(keys)
+
+    indices = {}
+    for i, key in enumerate(keys):
+        indices.setdefault(key, []).append(i)
+
+    for key, key_indices in indices.items():
+        decoration_list, cum_weights = get_decoration_candidates(world, *key)
+        if not len(decoration_list):
+            continue
+        selected = numpy.searchsorted(cum_weights, values[key_indices] * (cum_weights[-1] + 0.0), side="right")
+        for i, index in zip(key_indices, numpy.minimum(selected, len(decoration_list) - 1).tolist()):
+            decoration_blocks[i] = decoration_list[index]
+
+    return decoration_blocks
 
 
-def generate_decoration_block(world, x, y, decoration_block, flipped, side):
-    expansion_length = int(sqrt(random.random() * (world.block_generation_properties[decoration_block].get("expansion_length", 1) - 1) ** 2) + 1)
+def generate_decoration_block(world, rng, x, y, decoration_block, flipped, side):
+    expansion_length = int(sqrt(rng.random() * (world.block_generation_properties[decoration_block].get("expansion_length", 1) - 1) ** 2) + 1)
     expansion_direction = {"up": pi / 2, "down": -pi / 2, "left": pi, "right": 0}.get(world.block_generation_properties[decoration_block].get("expansion_direction", "up"), 0)
 
     size = world.block_group_size.get(decoration_block, (1, 1))
@@ -292,7 +423,7 @@ def generate_decoration_block(world, x, y, decoration_block, flipped, side):
 
             block_type = world.block_name[decoration_block] + flipped
             world.set_block(x + dx, y + dy, block_type)
-            flipped = random.randint(0, 1)
+            flipped = rng.randint(0, 1)
 
     else:
         width, height = world.block_group_size[decoration_block]
@@ -314,9 +445,8 @@ def generate_decoration_block(world, x, y, decoration_block, flipped, side):
             raise Exception("Grouped blocks on walls not implemented yet!")
 
         # Check for collisions
-        for dx, dy in numpy.ndindex(size):
-            if any(world.get_block(coord[0] + dx, coord[1] - dy, layer=slice(3), default=[1])):
-                return
+        if world.read_region(coord[0], coord[1] - height + 1, coord[0] + width, coord[1] + 1, slice(3), default=1).any():
+            return
 
         # Place blocks
         for x in range(width):
@@ -326,87 +456,200 @@ def generate_decoration_block(world, x, y, decoration_block, flipped, side):
                 world.set_block(coord[0] + x, coord[1] - y, block_type)
 
 
-# Called from generate_world
-def generate_poles(world, poles, blocks_ground, blocks_ceiling):
-    blocks_ground = dict(blocks_ground)
-    blocks_ceiling = dict(blocks_ceiling)
+# Called from settle_caves
+def generate_pole(world, rng, x, start_y, end_y):
+    """
+    Place a pole in a vertical cave. Returns whether the pole was placed.
+    If the pole does not fit, it is searched in a wider area, then the vertical cave is carved again as a straight shaft.
+    """
+    pole = find_pole(world, x, 2)
+    if pole is None:
+        pole = find_pole(world, x, WORLD_GENERATION_POLE_SEARCH_RADIUS)
+    if pole is None:
+        cave.shaft(world, x, start_y, end_y)
+        pole = find_pole(world, x, 2)
+    if pole is None:
+        print("Could not generate a pole at x=" + str(x))
+        return False
+
+    pole_x, pole_y_ground, pole_y_ceiling = pole
+    pole_block = rng.choice(("pole", "rope", "vines0"))
+    if pole_block == "pole":
+        pole_y_ceiling -= 2
+    else:
+        pole_y_ground += 2
+        pole_y_ceiling += 1
 
-    for x in poles:
-        pole_x = x
-        pole_y_ground = 0
-        pole_y_ceiling = 0
-        pole_height = 0
+    for y in range(pole_y_ground, pole_y_ceiling):
+        world.set_block(pole_x, y, world.block_name[pole_block])
+        world.set_block(pole_x, y, 0, 0)
 
-        for x_offest in range(-2, 3):
-            if not ((x + x_offest) in blocks_ground and (x + x_offest) in blocks_ceiling):
-                continue
+    return True
 
-            y_ground = blocks_ground[x + x_offest]
-            y_ceiling = max(y_ground, blocks_ceiling[x + x_offest])
-
-            found_dirt_above = False
-            for _y in range(50):
-                y = y_ceiling + _y
-                if not world.get_block_exists(x + x_offest, y):
-                    break
-                block = world.get_block(x + x_offest, y)
-                if block and not found_dirt_above:
-                    found_dirt_above = True
-                elif found_dirt_above and not block:
-                    y_ceiling = y
-
-            height = y_ceiling - y_ground - abs(x_offest)
-
-            if height > pole_height:
-                pole_x = x + x_offest
-                pole_y_ground = y_ground
-                pole_y_ceiling = y_ceiling
-                pole_height = height
-
-        if not pole_height:
-            print("Could not generate a pole at x=" + str(x))
-            return False
-        
-        pole_block = random.choice(("pole", "rope", "vines0"))
-        if pole_block == "pole":
-            pole_y_ceiling -= 2
-        else:
-            pole_y_ground += 2
-            pole_y_ceiling += 1
 
-        for y in range(pole_y_ground, pole_y_ceiling):
-            world.set_block(pole_x, y, world.block_name[pole_block])
-            world.set_block(pole_x, y, 0, 0)
+# Called from generate_pole
+def find_pole(world, x, radius):
+    """
+    Returns the highest pole (pole_x, y_ground, y_ceiling) within radius of x or None.
+    """
+    blocks_ground, blocks_ceiling = find_column_edge_blocks(world, x - radius, x + radius + 1)
+    pole_x = x
+    pole_y_ground = 0
+    pole_y_ceiling = 0
+    pole_height = 0
+
+    for x_offest in range(-radius, radius + 1):
+        column_ground = blocks_ground[blocks_ground[:, 0] == x + x_offest, 1]
+        column_ceiling = blocks_ceiling[blocks_ceiling[:, 0] == x + x_offest, 1]
+        if not (len(column_ground) and len(column_ceiling)):
+            continue
 
-    return True
+        y_ground = int(column_ground.max())
+        y_ceiling = max(y_ground, int(column_ceiling.max()))
+
+        found_dirt_above = False
+        for _y in range(50):
+            y = y_ceiling + _y
+            if not world.get_block_exists(x + x_offest, y):
+                break
+            block = world.get_block(x + x_offest, y)
+            if block and not found_dirt_above:
+                found_dirt_above = True
+            elif found_dirt_above and not block:
+                y_ceiling = y
+
+        height = y_ceiling - y_ground - abs(x_offest)
 
+        if height > pole_height:
+            pole_x = x + x_offest
+            pole_y_ground = y_ground
+            pole_y_ceiling = y_ceiling
+            pole_height = height
 
-# Called from generate_world
-def flatten_edges(world):
-    world_copy = copy.deepcopy(world)
-    for x, y in world_copy.iterate():
-        block_types = [world_copy.get_block(x + dx, y + dy, layer=0, default=1) for dx in range(-1, 2) for dy in range(-1, 2)]
-        block_type = max(block_types, key=block_types.count)
-        world.set_block(x, y, block_type)
+    if not pole_height:
+        return None
+    return pole_x, pole_y_ground, pole_y_ceiling
+
+
+# Called from find_pole
+def find_column_edge_blocks(world, start_x, end_x):
+    """
+    Returns the ground and ceiling blocks (n x 2) of the columns from start_x to end_x (excluded).
+    Only blocks between the lowest and highest chunk of a column are included.
+    """
+    blocks_ground = [numpy.empty((0, 2), dtype=int)]
+    blocks_ceiling = [numpy.empty((0, 2), dtype=int)]
+
+    for chunk_x in range(start_x >> WORLD_CHUNK_SIZE_POWER, ((end_x - 1) >> WORLD_CHUNK_SIZE_POWER) + 1):
+        chunks_y = [chunk_y for coord_x, chunk_y in world.get_chunk_coords(chunk_x, chunk_x + 1)]
+        if not chunks_y:
+            continue
+
+        edges = find_edge_blocks(
+            world,
+            max(start_x, chunk_x * WORLD_CHUNK_SIZE), min(chunks_y) * WORLD_CHUNK_SIZE,
+            min(end_x, (chunk_x + 1) * WORLD_CHUNK_SIZE), (max(chunks_y) + 1) * WORLD_CHUNK_SIZE
+        )
+        blocks_ground.append(edges[0])
+        blocks_ceiling.append(edges[1])
+
+    return numpy.concatenate(blocks_ground), numpy.concatenate(blocks_ceiling)
+
+
+# Called from settle_caves
+def flatten_edges(world, coords):
+    """
+    Set each block of chunks to the most common block of its 3x3 neighbourhood.
+    Ties are resolved in favour of the block found first (left to right, bottom to top).
+    """
+    flattened = {}
 
+    for chunk_x, chunk_y in coords:
+        padded = get_padded_layer(world, chunk_x, chunk_y, 0, 1, world.block_name["dirt_block"])
+        neighbours = [padded[1 + dx:1 + dx + WORLD_CHUNK_SIZE, 1 + dy:1 + dy + WORLD_CHUNK_SIZE] for dx in range(-1, 2) for dy in range(-1, 2)]
 
-def generate_block(world, x, y, repeat=0):
-    if x > 30:
-        z = snoise2(x / 8 + world.seed, y / 8 + world.seed, octaves=3, persistence=0.1, lacunarity=5)
-    if x > 20: # Interpolation (from intro)
-        z1 = snoise2(x / 16 + world.seed, y / 16, octaves=3, persistence=0.1, lacunarity=5, repeaty=repeat / 16)
-        z2 = snoise2(x / 8 + world.seed, y / 8 + world.seed, octaves=3, persistence=0.1, lacunarity=5)
-        i = (x - 20) / 10
-        z = z1 * i + z2 * (1 - i)
-    else: # Repeating (intro)
-        z = snoise2(x / 16 + world.seed, y / 16, octaves=3, persistence=0.1, lacunarity=5, repeaty=repeat / 16)
+        best_score = numpy.full((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE), -1)
+        best_block = numpy.zeros((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE), dtype=padded.dtype)
+
+        for block_type in numpy.unique(padded).tolist():
+            count = numpy.zeros((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE), dtype=int)
+            first = numpy.full((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE), len(neighbours))
+            for index, neighbour in enumerate(neighbours):
+                equal = neighbour == block_type
+                count += equal
+                first = numpy.where(equal & (first == len(neighbours)), index, first)
+
+            score = count * (len(neighbours) + 1) + len(neighbours) - first
+            better = score > best_score
+            best_score[better] = score[better]
+            best_block[better] = block_type
+
+        flattened[(chunk_x, chunk_y)] = best_block
+
+    # Write after all chunks are filtered, so that each chunk sees unfiltered neighbours
+    for (chunk_x, chunk_y), blocks in flattened.items():
+        world.blit(chunk_x * WORLD_CHUNK_SIZE, chunk_y * WORLD_CHUNK_SIZE, blocks, 0)
+
+
+def get_padded_layer(world, chunk_x, chunk_y, layer, padding, default):
+    """
+    Returns a layer of a chunk with a border of blocks from neighbouring chunks.
+    Blocks of chunks which do not exist are set to default.
+    """
+    start_x = chunk_x * WORLD_CHUNK_SIZE - padding
+    start_y = chunk_y * WORLD_CHUNK_SIZE - padding
+    return world.read_region(start_x, start_y, start_x + WORLD_CHUNK_SIZE + padding * 2, start_y + WORLD_CHUNK_SIZE + padding * 2, layer, default)
+
+
+# Called from generate_chunks
+def generate_terrain(world, chunks, repeat=0):
+    """
+    Fill all terrain blocks (dirt_block) of chunks with dirt, grass and stone.
+    All chunks are filled in one batch, which reads the unfilled chunks, so the result does not depend on the order.
+    """
+    coords = [coord for coord in chunks if (world.chunks[coord][:, :, 0] == world.block_name["dirt_block"]).any()]
+    if not coords:
+        return
+
+    for (chunk_x, chunk_y), chunk_blocks in zip(coords, get_terrain_blocks(world, coords, repeat)):
+        world.blit(chunk_x * WORLD_CHUNK_SIZE, chunk_y * WORLD_CHUNK_SIZE, chunk_blocks, 0)
+
+
+def get_terrain_blocks(world, coords, repeat=0):
+    """
+    Returns the foreground blocks of chunks with filled terrain blocks.
+    """
+    chunks = numpy.stack([world.chunks[coord][:, :, 0] for coord in coords])
+    chunk_x, chunk_y = numpy.array(coords).T
+    x = (chunk_x[:, numpy.newaxis] * WORLD_CHUNK_SIZE + numpy.arange(WORLD_CHUNK_SIZE))[:, :, numpy.newaxis]
+    y = (chunk_y[:, numpy.newaxis] * WORLD_CHUNK_SIZE + numpy.arange(WORLD_CHUNK_SIZE))[:, numpy.newaxis, :]
+
+    z1 = snoise2_array(x / 16 + world.seed, y / 16, octaves=3, persistence=0.1, lacunarity=5, repeaty=repeat / 16)
+    z2 = snoise2_array(x / 8 + world.seed, y / 8 + world.seed, octaves=3, persistence=0.1, lacunarity=5)
+    i = (x - 20) / 10
+    z = numpy.where(x > 20, z1 * i + z2 * (1 - i), z1) # Interpolation (from intro) or repeating (intro)
 
     threshold = 0.2 # -1 < z < 1
 
-    block = "dirt_block"
-    if z < threshold and world.get_block(x, y + 1) == 0: # When air is above
-        block = "grass_block"
-    elif z >= threshold:
-        block = "stone_block"
-    
-    world.set_block(x, y, world.block_name[block])
+    # Blocks above, including the bottom row of the chunk above
+    above = numpy.empty(chunks.shape, dtype=chunks.dtype)
+    above[:, :, :-1] = chunks[:, :, 1:]
+    for index, (coord_x, coord_y) in enumerate(coords):
+        above[index, :, -1] = world.chunks[(coord_x, coord_y + 1)][:, 0, 0] if (coord_x, coord_y + 1) in world.chunks else 0
+
+    block = numpy.full(chunks.shape, world.block_name["dirt_block"], dtype=chunks.dtype)
+    block[(z < threshold) & (above == 0)] = world.block_name["grass_block"] # When air is above
+    block[z >= threshold] = world.block_name["stone_block"]
+
+    return numpy.where(chunks == world.block_name["dirt_block"], block, chunks)
+
+
+def get_world_hash(world):
+    """
+    Returns a hash of all chunks. Worlds generated with the same seed must have the same hash.
+    """
+    world_hash = hashlib.sha1()
+    for chunk_x, chunk_y in sorted(tuple(world.chunks)):
+        world_hash.update(f"{chunk_x},{chunk_y}".encode())
+        world_hash.update(world.chunks[(chunk_x, chunk_y)].tobytes())
+    return world_hash.hexdigest()
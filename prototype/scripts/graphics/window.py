@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from scripts.graphics.image import load_sprites, get_sprite_rect
-from scripts.utility.const import OPENGL_VERSION, PLATFORM
+from scripts.utility.const import OPENGL_VERSION, PLATFORM, WORLD_CHUNK_DTYPE
 from scripts.utility.language import translate
 from scripts.graphics.shader import Shader
 from scripts.graphics.camera import Camera
@@ -127,7 +127,9 @@ class Window:
             (self.width, self.height), flags=flags, vsync=self.options["enable vsync"])
         self._clock = pygame.time.Clock()
         self.camera: Camera = Camera(self)
-        self.world_view: numpy.array = numpy.empty((0, 0, 4))
+        self.world_view: numpy.array = numpy.empty((0, 0, 4), dtype=WORLD_CHUNK_DTYPE) # Ring buffer
+        self.world_view_origin: [int] = (0, 0) # Position of the first visible block in the ring buffer
+        self.world_view_updates: list = [] # Changed rectangles of the ring buffer (x, y, width, height)
         pygame.display.set_caption(caption)
         pygame.key.set_repeat(500, 50)
 
@@ -255,6 +257,7 @@ class Window:
                 "texWorld": "int",
                 "texShadow": "int",
                 "offset": "vec2",
+                "world_origin": "ivec2",
                 "camera": "vec2",
                 "resolution": "float",
                 "shadow_resolution": "float",
@@ -629,7 +632,9 @@ class Window:
         """
         Clear the world view.
         """
-        self.world_view.fill(0)
+        if all(self.world_view.shape):
+            self.world_view = numpy.empty((0, 0, 4), dtype=WORLD_CHUNK_DTYPE)
+            self.world_view_updates.clear()
 
     def _texture(self, image, blur=False):
         """
@@ -684,6 +689,7 @@ class Window:
 
         # Send variables to shader
         self._instance_shader.setvar("offset", *offset)
+        self._instance_shader.setvar("world_origin", *self.world_view_origin)
         self._instance_shader.setvar("camera", *self.camera.pos)
         if self.resolution != self.camera.resolution:
             self.resolution = self.camera.resolution
@@ -691,8 +697,6 @@ class Window:
 
         # View size
         size = self.world_view.shape[:2]
-        data = numpy.array(numpy.swapaxes(
-            self.world_view, 0, 1), dtype=numpy.int32)
 
         if self._world_size != size:
             if not self._texWorld is None:
@@ -702,10 +706,11 @@ class Window:
 
         if self._texWorld is None:
             # Generate new texture
+            data = numpy.ascontiguousarray(numpy.swapaxes(self.world_view, 0, 1))
             texture = GL.glGenTextures(1)
             GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
-            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA32I, *
-                            self._world_size, 0, GL.GL_RGBA_INTEGER, GL.GL_INT, data)
+            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA16I, *
+                            self._world_size, 0, GL.GL_RGBA_INTEGER, GL.GL_SHORT, data)
             GL.glTexParameteri(
                 GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
             GL.glTexParameteri(
@@ -719,20 +724,21 @@ class Window:
             GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
             self._texWorld = texture
         else:
-            # Write world data into texture
+            # Write changed world data into texture
             GL.glBindTexture(GL.GL_TEXTURE_2D, self._texWorld)
-            # GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA32I, *self._world_size, 0, GL.GL_RGBA_INTEGER, GL.GL_INT, data)
-            GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, *
-                               self._world_size, GL.GL_RGBA_INTEGER, GL.GL_INT, data)
+            for x, y, width, height in self.world_view_updates:
+                data = numpy.ascontiguousarray(numpy.swapaxes(self.world_view[x:x + width, y:y + height], 0, 1))
+                GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, x, y, width, height, GL.GL_RGBA_INTEGER, GL.GL_SHORT, data)
             # GL.glBufferData(GL.GL_TEXTURE_2D, data.nbytes, data, GL.GL_STREAM_COPY)
+        self.world_view_updates.clear()
 
     def _draw_shadows(self, offset, player_position):
         """
         Calculate and draw shadows.
         """
         # t = time.time()
-        # Create view copy
-        view = self.world_view.copy()[:, :, 0]
+        # Create view copy (unwrap ring buffer)
+        view = numpy.roll(self.world_view[:, :, 0], (-self.world_view_origin[0], -self.world_view_origin[1]), axis=(0, 1))
         view[0, :] = 0
         view[:, 0] = 0
         view[-1, :] = 0
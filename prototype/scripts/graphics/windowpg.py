@@ -2,7 +2,7 @@
 from scripts.graphics.image import load_sprites, get_sprite_rect
 from scripts.utility.language import translate
 from scripts.graphics.camera import Camera
-from scripts.utility.const import PLATFORM
+from scripts.utility.const import PLATFORM, WORLD_CHUNK_DTYPE
 from scripts.graphics import particle
 from scripts.utility import options
 from scripts.utility import file
@@ -85,7 +85,9 @@ class Window:
         self._window = pygame.display.set_mode((self.width, self.height), flags=flags, vsync=self.options["enable vsync"])
         self._clock = pygame.time.Clock()
         self.camera: Camera = Camera(self)
-        self.world_view: numpy.array = numpy.empty((0, 0, 4))
+        self.world_view: numpy.array = numpy.empty((0, 0, 4), dtype=WORLD_CHUNK_DTYPE) # Ring buffer
+        self.world_view_origin: [int] = (0, 0) # Position of the first visible block in the ring buffer
+        self.world_view_updates: list = [] # Changed rectangles of the ring buffer (unused)
         pygame.display.set_caption(caption)
         pygame.key.set_repeat(500, 50)
 
@@ -315,7 +317,9 @@ class Window:
         """
         Clear the world view.
         """
-        self.world_view.fill(0)
+        if all(self.world_view.shape):
+            self.world_view = numpy.empty((0, 0, 4), dtype=WORLD_CHUNK_DTYPE)
+            self.world_view_updates.clear()
     
     def _texture(self, image, blur=False):
         """
@@ -490,9 +494,12 @@ class Window:
             self.camera.pos[1] % 1 - (self.height / 2 / self.camera.pixels_per_meter) % 1
         )
 
-        for x_coord, y_coord in numpy.ndindex(self.world_view.shape[:2]):
+        world_view = numpy.roll(self.world_view, (-self.world_view_origin[0], -self.world_view_origin[1]), axis=(0, 1))
+        self.world_view_updates.clear()
+
+        for x_coord, y_coord in numpy.ndindex(world_view.shape[:2]):
             for layer in (2, 0, 1):
-                block = self.world_view[x_coord, y_coord][layer]
+                block = world_view[x_coord, y_coord][layer]
                 if block != 0:
                     rect = self.camera.map_coord((x_coord + 1 + floor(self.camera.pos[0] - self.world_view.shape[0] / 2 - offset[0]), y_coord + floor(self.camera.pos[1] - self.world_view.shape[1] / 2 - offset[1]), 1, 1), from_world=True)
                     dest_rect = (
@@ -410,6 +410,7 @@ class Menu:
         ###---###  Delete world page  ###---###
         def button_delete_world_confirm_update():
             file.delete("data/user/world.data")
+            file.delete("data/user/world.data.journal")
             settings_world_page.open()
 
         delete_world_page = Page(parent=settings_world_page, columns=1, spacing=MENU_SPACING)
@@ -425,6 +426,7 @@ class Menu:
         def button_delete_inventory_confirm_update():
             if file.exists("data/user/world.data"):
                 file.delete("data/user/world.data")
+                file.delete("data/user/world.data.journal")
             if file.exists("data/user/inventory.data"):
                 file.delete("data/user/inventory.data")
             settings_world_page.open()
@@ -66,16 +66,35 @@ PHYSICS_GRAVITY_CONSTANT: float = 9.81 if PHYSICS_REALISTIC else 15
 PHYSICS_FRICTION_X: float = 0.1
 PHYSICS_JUMP_THRESHOLD: int = 3 # Time to jump after leaving the ground in ticks
 PHYSICS_WALL_JUMP_THRESHOLD: float = 0.3 # Time to jump after leaving a wall in seconds
-PHYSICS_MAX_MOVE_DISTANCE: float = 1.0 # Maximum distance in blocks, which an object can travel each tick
+PHYSICS_CONTACT_EPSILON: float = 1e-6 # Distance in blocks, within which an edge counts as touching a block boundary
 
 BLOCKS_CLIMBABLE: tuple = ("pole", "vines0", "vines0_flipped", "ladder", "rope")
+BLOCKS_LIGHT: tuple = ("torch", "torch_flipped") # Blocks which emit light
+BLOCKS_DEFAULT_FRICTION: float = 0.1 # Friction of blocks without friction property
+
+STRUCTURE_CACHE_PATH: str = "data/user/structures.cache" # Structures compiled for the current block indices
 
 WORLD_UPDATE_INTERVAL = 0.1 # Delay between world updates
 WORLD_CHUNK_SIZE_POWER = 5
 WORLD_CHUNK_SIZE = 2 ** WORLD_CHUNK_SIZE_POWER
+WORLD_CHUNK_DTYPE: str = "int16" # Block indices (layers 0-2) and signed water level (layer 3)
+WORLD_FILE_VERSION: int = 1 # Version of the chunked world file format
+WORLD_AUTOSAVE_INTERVAL: float = 10.0 # Seconds between writing changes into the world file journal
+WORLD_JOURNAL_LIMIT: int = 2 ** 22 # Journal size in bytes, after which the world file is saved completely
+WORLD_CHUNK_MEMORY_LIMIT: int = 2 ** 24 # Bytes of chunks in memory, the least recently used chunks are moved out of memory
+WORLD_SCRATCH_COMPACT_SIZE: int = 2 ** 22 # Size in bytes, after which the scratch file of chunks moved out of memory is compacted
+WORLD_POOL_PATH: str = "data/user/pool" # Folder of spare worlds, which are generated in the background
+WORLD_POOL_SIZE: int = 1 # Number of spare worlds
+WORLD_POOL_DISK_LIMIT: int = 2 ** 25 # Size of all spare worlds in bytes
+WORLD_POOL_NICENESS: int = 10 # Lower priority of the process generating spare worlds (POSIX only)
 WORLD_WATER_PER_BLOCK: int = 1000
+WORLD_WATER_STEPS: int = 4 # Water simulation steps per world update
+WORLD_WATER_LIMIT: int = 2 ** 15 - 1 # Highest water level storable in WORLD_CHUNK_DTYPE
 WORLD_WIND_STRENGTH: int = 20
 WORLD_BLOCK_SIZE: int = 16
+WORLD_ENTITY_CELL_SIZE: int = 4 # Cell size in blocks of the spatial hash of entities
+WORLD_SPAWN_DTYPE: str = "float32" # Spawn records of enemies (x, y, kind, weapon)
+WORLD_SPAWN_DISTANCE: int = 2 # Chunks outside the loaded blocks, after which enemies are stored as spawn records again
 
 WORLD_VEGETATION_FLOOR_DENSITY: float = 0.9
 WORLD_VEGETATION_CEILING_DENSITY: float = 0.4
@@ -85,6 +104,17 @@ WORLD_GENERATION_CAVE_BORDER_PADDING: int = 4
 WORLD_GENERATION_HORIZONTAL_CAVE_RADIUS: int = 3
 WORLD_GENERATION_STEP_SIZE: float = 0.5
 WORLD_GENERATION_INTERPOLATION_LENGTH: int = 20
+WORLD_GENERATION_POLE_SEARCH_RADIUS: int = 8 # Blocks around a vertical cave, which are searched for a pole if it does not fit
+WORLD_GENERATION_SHAFT_RADIUS: int = 2 # Radius of vertical caves, which are carved again for a pole
+WORLD_GENERATION_DISTANCE: int = 2 # Chunk columns right of the loaded blocks, which are generated in the background
+WORLD_GENERATION_SEGMENTS: int = 0 # Cave segments before the goal, 0: endless caves
+WORLD_GENERATION_CARVE_MARGIN: int = 64 # Blocks left of the end of the caves, which the next cave segment might carve
+
+# Generation stages of chunks, chunks without stage are generated completely
+WORLD_STAGE_CARVED: int = 0 # Caves, structures and poles
+WORLD_STAGE_TERRAIN: int = 1 # Dirt, grass and stone
+WORLD_STAGE_DECORATED: int = 2 # Foliage
+WORLD_STAGE_POPULATED: int = 3 # Enemies
 
 DAMAGE_COLORS: list = [(232, 193, 112, 255), (222, 158, 65, 255), (218, 134, 62, 255), (207, 87, 60, 255), (165, 48, 48, 255), (117, 36, 56, 255), (65, 29, 49, 255), (64, 39, 81, 255), (122, 54, 123, 255), (162, 62, 140, 255), (198, 81, 151, 255)]
 INT_TO_ROMAN: dict = {1: "I", 2: "II", 3: "III", 4: "IV", 5: "V", 6: "VI", 7: "VII", 8: "VIII", 9: "IX", 10: "X", 11: "XI", 12: "XII", 13: "XIII", 14: "XIV", 15: "XV", 16: "XVI", 17: "XVII", 18: "XVIII", 19: "XIX", 20: "XX"}
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+from opensimplex.constants import GRADIENTS2, STRETCH_CONSTANT2, SQUISH_CONSTANT2, NORM_CONSTANT2
+from opensimplex.internals import _init
 import opensimplex
+import numpy
 from math import *
 
 
@@ -30,3 +33,113 @@ def snoise2(x: float, y: float, octaves: int=1, persistence: float=0.5, lacunari
         z += opensimplex.noise2(x / divisor, y / divisor) / divisor
 
     return z
+
+
+def pnoise1_array(x, octaves: int=1, persistence: float=0.5, lacunarity: float=2.0, repeat: float=0):
+    """
+    Array version of pnoise1. Returns the same values as pnoise1 for each element of x.
+    """
+    x = numpy.asarray(x, dtype=float)
+    z = numpy.zeros(x.shape)
+    octaves = min(octaves, 3)
+
+    if repeat:
+        x = numpy.abs(numpy.sin(x * pi / repeat + 2.928) * repeat)
+
+    for i in range(octaves):
+        divisor = 2 ** i
+        z += noise2_array(x / divisor, numpy.full(x.shape, e)) / divisor
+
+    return z
+
+def snoise2_array(x, y, octaves: int=1, persistence: float=0.5, lacunarity: float=2.0, repeatx: float=0, repeaty: float=0):
+    """
+    Array version of snoise2. x and y are broadcast against each other.
+    Returns the same values as snoise2 for each pair of coordinates.
+    """
+    x, y = numpy.broadcast_arrays(numpy.asarray(x, dtype=float), numpy.asarray(y, dtype=float))
+    z = numpy.zeros(x.shape)
+    octaves = min(octaves, 3)
+
+    if repeatx:
+        x = numpy.abs(numpy.sin(x * pi / repeatx + 0.214) * repeatx)
+    if repeaty:
+        y = numpy.abs(numpy.sin(y * pi / repeaty + 1.331) * repeaty)
+
+    for i in range(octaves):
+        divisor = 2 ** i
+        z += noise2_array(x / divisor, y / divisor) / divisor
+
+    return z
+
+
+_permutations = {} # Permutation arrays of opensimplex by seed
+
+def noise2_array(x, y):
+    """
+    NumPy port of opensimplex.noise2, evaluated for each pair of coordinates.
+    opensimplex.noise2array only evaluates grids and is slow without numba.
+    """
+    seed = opensimplex.get_seed()
+    if not seed in _permutations:
+        _permutations[seed] = _init(seed)[0]
+    perm = _permutations[seed]
+
+    # Place input coordinates onto grid
+    stretch_offset = (x + y) * STRETCH_CONSTANT2
+    xs = x + stretch_offset
+    ys = y + stretch_offset
+
+    # Grid coordinates of rhombus super-cell origin
+    xsb = numpy.floor(xs)
+    ysb = numpy.floor(ys)
+    squish_offset = (xsb + ysb) * SQUISH_CONSTANT2
+    xins = xs - xsb
+    yins = ys - ysb
+    in_sum = xins + yins
+
+    # Positions relative to origin point
+    dx0 = x - (xsb + squish_offset)
+    dy0 = y - (ysb + squish_offset)
+    xsb = xsb.astype(numpy.int64)
+    ysb = ysb.astype(numpy.int64)
+
+    # Contributions (1,0) and (0,1)
+    value = _noise2_contribution(perm, xsb + 1, ysb, dx0 - 1 - SQUISH_CONSTANT2, dy0 - SQUISH_CONSTANT2)
+    value += _noise2_contribution(perm, xsb, ysb + 1, dx0 - SQUISH_CONSTANT2, dy0 - 1 - SQUISH_CONSTANT2)
+
+    # Triangle at (0,0) or (1,1)
+    lower = in_sum <= 1
+    zins = numpy.where(lower, 1 - in_sum, 2 - in_sum)
+    closest = numpy.where(lower, (zins > xins) | (zins > yins), (zins < xins) | (zins < yins))
+    x_greater = xins > yins
+
+    # Offset of the extra vertex
+    ext_x = numpy.select(
+        (lower & closest & x_greater, lower & closest, lower, closest & x_greater, closest),
+        (1, -1, 1, 2, 0), 0
+    )
+    ext_y = numpy.select(
+        (lower & closest & x_greater, lower & closest, lower, closest & x_greater, closest),
+        (-1, 1, 1, 0, 2), 0
+    )
+    squish_ext = (ext_x + ext_y) * SQUISH_CONSTANT2
+    dx_ext = dx0 - ext_x - squish_ext
+    dy_ext = dy0 - ext_y - squish_ext
+
+    # Contribution (0,0) or (1,1)
+    upper = ~lower
+    dx0 = numpy.where(upper, dx0 - 1 - 2 * SQUISH_CONSTANT2, dx0)
+    dy0 = numpy.where(upper, dy0 - 1 - 2 * SQUISH_CONSTANT2, dy0)
+    value += _noise2_contribution(perm, xsb + upper, ysb + upper, dx0, dy0)
+
+    # Extra vertex
+    value += _noise2_contribution(perm, xsb + ext_x, ysb + ext_y, dx_ext, dy_ext)
+
+    return value / NORM_CONSTANT2
+
+def _noise2_contribution(perm, xsv, ysv, dx, dy):
+    attn = numpy.maximum(2 - dx * dx - dy * dy, 0)
+    attn *= attn
+    index = perm[(perm[xsv & 0xFF] + ysv) & 0xFF] & 0x0E
+    return attn * attn * (GRADIENTS2[index] * dx + GRADIENTS2[index + 1] * dy)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from scripts.utility.geometry import Rect
+from math import *
+
+
+class SpatialHash:
+    """
+    Uniform grid of objects with a rect (object.rect).
+    Each object is stored in all cells which its rect overlaps, so queries only check objects of nearby cells.
+    """
+    def __init__(self, cell_size: float):
+        self.cell_size: float = cell_size
+        self.cells: dict = {} # {(cell_x, cell_y): set of objects}
+        self.object_cells: dict = {} # {object: (start_cell_x, start_cell_y, end_cell_x, end_cell_y)}
+
+    def get_cell_range(self, start_x: float, start_y: float, end_x: float, end_y: float):
+        return (
+            floor(start_x / self.cell_size), floor(start_y / self.cell_size),
+            floor(end_x / self.cell_size), floor(end_y / self.cell_size)
+        )
+
+    def insert(self, obj):
+        if obj in self.object_cells:
+            return self.move(obj)
+        cell_range = self.get_cell_range(obj.rect.x, obj.rect.y, obj.rect.x + obj.rect.w, obj.rect.y + obj.rect.h)
+        self.object_cells[obj] = cell_range
+        for cell in self.iterate_cells(*cell_range):
+            self.cells.setdefault(cell, set()).add(obj)
+
+    def remove(self, obj):
+        cell_range = self.object_cells.pop(obj, None)
+        if cell_range is None:
+            return
+        for cell in self.iterate_cells(*cell_range):
+            cell_objects = self.cells[cell]
+            cell_objects.discard(obj)
+            if not cell_objects:
+                del self.cells[cell]
+
+    def move(self, obj):
+        """
+        Update the cells of an object after its rect changed. Objects which were not inserted are ignored.
+        """
+        cell_range = self.object_cells.get(obj)
+        if cell_range is None:
+            return
+        if cell_range != self.get_cell_range(obj.rect.x, obj.rect.y, obj.rect.x + obj.rect.w, obj.rect.y + obj.rect.h):
+            self.remove(obj)
+            self.insert(obj)
+
+    @staticmethod
+    def iterate_cells(start_cell_x: int, start_cell_y: int, end_cell_x: int, end_cell_y: int):
+        for cell_x in range(start_cell_x, end_cell_x + 1):
+            for cell_y in range(start_cell_y, end_cell_y + 1):
+                yield cell_x, cell_y
+
+    def query_area(self, start_x: float, start_y: float, end_x: float, end_y: float):
+        """
+        Returns all objects of the cells which overlap an area. The objects might be outside of the area.
+        """
+        objects = set()
+        for cell in self.iterate_cells(*self.get_cell_range(start_x, start_y, end_x, end_y)):
+            if cell in self.cells:
+                objects.update(self.cells[cell])
+        return objects
+
+    def query_rect(self, rect: Rect):
+        """
+        Returns the objects whose rect collides with rect.
+        """
+        return {obj for obj in self.query_area(rect.x, rect.y, rect.x + rect.w, rect.y + rect.h) if obj.rect.collide_rect(rect)}
+
+    def query_radius(self, center: [float], radius: float):
+        """
+        Returns the objects whose rect center is within radius of center.
+        """
+        return {
+            obj for obj in self.query_area(center[0] - radius, center[1] - radius, center[0] + radius, center[1] + radius)
+            if dist(obj.rect.center, center) <= radius
+        }
+
+    def query_segment(self, start: [float], end: [float]):
+        """
+        Returns the objects whose rect collides with the line from start to end.
+        """
+        return {
+            obj for obj in self.query_area(min(start[0], end[0]), min(start[1], end[1]), max(start[0], end[0]), max(start[1], end[1]))
+            if obj.rect.collide_line(start, end)
+        }
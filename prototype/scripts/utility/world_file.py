@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+from scripts.utility.const import *
+from scripts.utility import file
+import threading
+import tempfile
+import struct
+import json
+import mmap
+import zlib
+
+
+# File layout: header, section table, sections
+# The "chunks" section contains the compressed chunk arrays, which are located with the "index" section.
+MAGIC = b"LHWF"
+HEADER = struct.Struct("<4sII") # Magic, version, section count
+SECTION = struct.Struct("<16sQQ") # Name, offset, length
+INDEX_DTYPE = numpy.int64 # (chunk_x, chunk_y, offset, length)
+
+# Changes since the last complete save are appended to a journal next to the world file.
+# Only records with the save id of the world file are applied.
+JOURNAL_MAGIC = b"LHWJ"
+JOURNAL_RECORD = struct.Struct("<4sQQI") # Magic, save id, payload length, payload checksum
+JOURNAL_ENTRY = struct.Struct("<16sqqQ") # Section name or "chunk", chunk_x, chunk_y, length
+
+
+def is_world_file(path: str):
+    """
+    Returns whether a file is written in the chunked world file format.
+    """
+    with open(file.abspath(path), "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def encode_chunk(chunk):
+    return zlib.compress(chunk.tobytes(), 1)
+
+
+def decode_chunk(data, dtype: str=WORLD_CHUNK_DTYPE):
+    chunk = numpy.frombuffer(zlib.decompress(data), dtype=dtype)
+    return chunk.reshape((WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE, 4)).astype(WORLD_CHUNK_DTYPE)
+
+
+def save(path: str, sections: dict, chunks: dict):
+    """
+    Write a world file. The file is replaced only after it was written completely.
+    sections: {name: bytes}, compressed when written
+    chunks: {(chunk_x, chunk_y): chunk array or encoded chunk}
+    """
+    path = file.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Chunks
+    index = numpy.zeros((len(chunks), 4), dtype=INDEX_DTYPE)
+    blobs = []
+    offset = 0
+    for i, ((chunk_x, chunk_y), chunk) in enumerate(chunks.items()):
+        blob = chunk if isinstance(chunk, bytes) else encode_chunk(chunk)
+        index[i] = (chunk_x, chunk_y, offset, len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+
+    sections = {
+        **{name: zlib.compress(data, 1) for name, data in sections.items()},
+        "format": json.dumps({"dtype": WORLD_CHUNK_DTYPE, "shape": [WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE, 4]}).encode(),
+        "index": index.tobytes(),
+        "chunks": b"".join(blobs)
+    }
+
+    # Section table
+    table = []
+    offset = HEADER.size + SECTION.size * len(sections)
+    for name, data in sections.items():
+        table.append(SECTION.pack(name.encode(), offset, len(data)))
+        offset += len(data)
+
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, WORLD_FILE_VERSION, len(sections)))
+        f.write(b"".join(table))
+        for data in sections.values():
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+    # The journal belongs to the replaced file
+    if os.path.exists(path + ".journal"):
+        os.remove(path + ".journal")
+
+
+def get_journal_size(path: str):
+    path = file.abspath(path) + ".journal"
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    return 0
+
+
+def append_journal(path: str, save_id: int, sections: dict, chunks: dict):
+    """
+    Append changed sections and chunks to the journal of a world file.
+    A record which was not written completely is ignored when the journal is read.
+    chunks: {(chunk_x, chunk_y): chunk array or encoded chunk}
+    """
+    entries = []
+    for name, data in sections.items():
+        data = zlib.compress(data, 1)
+        entries += [JOURNAL_ENTRY.pack(name.encode(), 0, 0, len(data)), data]
+    for (chunk_x, chunk_y), chunk in chunks.items():
+        data = chunk if isinstance(chunk, bytes) else encode_chunk(chunk)
+        entries += [JOURNAL_ENTRY.pack(b"chunk", chunk_x, chunk_y, len(data)), data]
+    payload = b"".join(entries)
+
+    with open(file.abspath(path) + ".journal", "ab") as f:
+        f.write(JOURNAL_RECORD.pack(JOURNAL_MAGIC, save_id, len(payload), zlib.crc32(payload)) + payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal(path: str, save_id: int):
+    """
+    Returns the newest sections and encoded chunks of all complete journal records of a world file.
+    Chunks are returned with the block indices (blocks section) of their record, as they might differ between sessions.
+    An incomplete record at the end of the journal is removed.
+    chunks: {(chunk_x, chunk_y): (encoded chunk, blocks section or None)}
+    """
+    sections = {}
+    chunks = {}
+    path = file.abspath(path) + ".journal"
+    if not os.path.exists(path):
+        return sections, chunks
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset = 0
+    while offset + JOURNAL_RECORD.size <= len(data):
+        magic, record_save_id, length, checksum = JOURNAL_RECORD.unpack_from(data, offset)
+        payload = data[offset + JOURNAL_RECORD.size:offset + JOURNAL_RECORD.size + length]
+        if magic != JOURNAL_MAGIC or len(payload) != length or zlib.crc32(payload) != checksum:
+            break
+        offset += JOURNAL_RECORD.size + length
+        if record_save_id != save_id:
+            continue
+
+        record_blocks = None
+        position = 0
+        while position < length:
+            name, chunk_x, chunk_y, entry_length = JOURNAL_ENTRY.unpack_from(payload, position)
+            position += JOURNAL_ENTRY.size
+            entry = payload[position:position + entry_length]
+            position += entry_length
+
+            name = name.rstrip(b"\0").decode()
+            if name == "chunk":
+                chunks[(chunk_x, chunk_y)] = (entry, record_blocks)
+            else:
+                sections[name] = zlib.decompress(entry)
+                if name == "blocks":
+                    record_blocks = sections[name]
+
+    if offset < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+
+    return sections, chunks
+
+
+def get_pool_paths():
+    """
+    Returns the paths of the spare worlds in the world pool.
+    """
+    path = file.abspath(WORLD_POOL_PATH)
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".data"))
+
+
+def get_pool_size():
+    return sum(os.path.getsize(path) for path in get_pool_paths())
+
+
+def take_pool_world(path: str):
+    """
+    Move a spare world of the world pool to path. Returns whether the pool contained a spare world.
+    """
+    paths = get_pool_paths()
+    if not paths:
+        return False
+    path = file.abspath(path)
+    if os.path.exists(path + ".journal"):
+        os.remove(path + ".journal")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(paths[0], path)
+    return True
+
+
+class WorldFile:
+    """
+    Memory mapped world file. Chunks are only decoded when they are read.
+    """
+    def __init__(self, path: str):
+        self.path: str = path
+        self.file = open(file.abspath(path), "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty file
+            self.file.close()
+            raise Exception("World file is empty")
+
+        magic, version, section_count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise Exception("Not a world file")
+        if version > WORLD_FILE_VERSION:
+            self.close()
+            raise Exception(f"World file version {version} is not supported")
+
+        self.sections: dict = {}
+        for i in range(section_count):
+            name, offset, length = SECTION.unpack_from(self.data, HEADER.size + SECTION.size * i)
+            self.sections[name.rstrip(b"\0").decode()] = (offset, length)
+
+        chunk_format = json.loads(self.read_raw_section("format"))
+        self.dtype = chunk_format["dtype"]
+        self.shape = tuple(chunk_format["shape"])
+        if self.shape != (WORLD_CHUNK_SIZE, WORLD_CHUNK_SIZE, 4):
+            self.close()
+            raise Exception("World file has a different chunk size")
+
+        chunks_offset = self.sections["chunks"][0]
+        index = numpy.frombuffer(self.read_raw_section("index"), dtype=INDEX_DTYPE).reshape(-1, 4)
+        self.chunks: dict = {(chunk_x, chunk_y): (chunks_offset + offset, length) for chunk_x, chunk_y, offset, length in index.tolist()}
+
+    def read_section(self, name: str):
+        return zlib.decompress(self.read_raw_section(name))
+
+    def read_raw_section(self, name: str):
+        offset, length = self.sections[name]
+        return self.data[offset:offset + length]
+
+    def read_chunk_data(self, coord: tuple):
+        """
+        Returns the encoded data of a chunk.
+        """
+        offset, length = self.chunks[coord]
+        return self.data[offset:offset + length]
+
+    def read_chunk(self, coord: tuple):
+        """
+        Returns a decoded chunk array.
+        """
+        return decode_chunk(self.read_chunk_data(coord), self.dtype)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class ScratchFile:
+    """
+    Temporary file of encoded chunks, which were removed from memory.
+    Chunks are removed from the file when they are read. The file is deleted when it is closed.
+    """
+    def __init__(self):
+        self.file = None # Created when the first chunk is written
+        self.chunks: dict = {} # {(chunk_x, chunk_y): (offset, length)}
+        self.size: int = 0 # Bytes of the chunks in the file
+        self.lock: threading.Lock = threading.Lock()
+
+    def write_chunk(self, coord: tuple, chunk):
+        """
+        Append a chunk array or encoded chunk.
+        """
+        data = chunk if isinstance(chunk, bytes) else encode_chunk(chunk)
+        with self.lock:
+            if self.file is None:
+                self.file = tempfile.TemporaryFile()
+            if coord in self.chunks:
+                self.size -= self.chunks[coord][1]
+
+            offset = self.file.seek(0, os.SEEK_END)
+            self.file.write(data)
+            self.chunks[coord] = (offset, len(data))
+            self.size += len(data)
+
+            if offset > WORLD_SCRATCH_COMPACT_SIZE and offset > self.size * 2:
+                self.compact()
+
+    def read_chunk_data(self, coord: tuple):
+        """
+        Returns the encoded data of a chunk without removing it.
+        """
+        with self.lock:
+            offset, length = self.chunks[coord]
+            self.file.seek(offset)
+            return self.file.read(length)
+
+    def read_chunk(self, coord: tuple):
+        """
+        Returns a decoded chunk array and removes it from the file.
+        """
+        data = self.read_chunk_data(coord)
+        self.remove_chunk(coord)
+        return decode_chunk(data)
+
+    def remove_chunk(self, coord: tuple):
+        with self.lock:
+            self.size -= self.chunks.pop(coord)[1]
+            if not self.chunks: # Reuse the space
+                self.file.truncate(0)
+
+    def compact(self):
+        """
+        Write the chunks into a new file, without the space of removed chunks.
+        """
+        new_file = tempfile.TemporaryFile()
+        for coord, (offset, length) in self.chunks.items():
+            self.file.seek(offset)
+            self.chunks[coord] = (new_file.tell(), length)
+            new_file.write(self.file.read(length))
+        self.file.close()
+        self.file = new_file
+
+    def close(self):
+        with self.lock:
+            if not self.file is None:
+                self.file.close()
+                self.file = None
+            self.chunks.clear()
+            self.size = 0